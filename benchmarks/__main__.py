@@ -0,0 +1,100 @@
+"""Runs the benchmark suite.
+
+    python -m benchmarks [--only NAME ...] [--repeat N] [--scale N]
+                         [--output results.json] [--baseline baseline.json]
+                         [--threshold 0.2]
+
+Every benchmark runs in a temporary working directory on synthetic data,
+so no network access is needed. With ``--baseline`` every result is
+compared with the baseline and the exit status is 1 when one regressed by
+more than ``--threshold``.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import numpy as np
+from loguru import logger
+
+from .suite import BENCHMARKS
+
+
+def compare(results, baseline, threshold):
+    """Returns (name, baseline, current, ratio) for every regressed result.
+
+    Times regress when they grow, throughputs when they shrink.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None or base["value"] == 0 or result["value"] == 0:
+            continue
+        if result["unit"] == "items/s":
+            ratio = base["value"] / result["value"]
+        else:
+            ratio = result["value"] / base["value"]
+        if ratio > 1 + threshold:
+            regressions.append((name, base["value"], result["value"], ratio))
+    return regressions
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = "python -m benchmarks")
+    parser.add_argument("--only", nargs = "+", choices = sorted(BENCHMARKS), default = sorted(BENCHMARKS))
+    parser.add_argument("--repeat", type = int, default = 10)
+    parser.add_argument("--scale", type = int, default = 1, help = "multiplies dataset and cache sizes")
+    parser.add_argument("--output", help = "JSON file to write the results to")
+    parser.add_argument("--baseline", help = "JSON results of an earlier run to compare with")
+    parser.add_argument("--threshold", type = float, default = 0.2)
+    args = parser.parse_args(argv)
+
+    logger.remove()
+    logger.add(sys.stderr, level = "ERROR")
+
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workspace:
+        os.chdir(workspace)
+        try:
+            for name in args.only:
+                start = time.perf_counter()
+                results.update(BENCHMARKS[name](args.repeat, args.scale))
+                print("{name}: {elapsed:.2f}s".format(name = name, elapsed = time.perf_counter() - start), file = sys.stderr)
+        finally:
+            os.chdir(cwd)
+
+    for name, result in sorted(results.items()):
+        print("{name:40} {value:14.6g} {unit}".format(name = name, **result))
+
+    report = {
+        "meta" : {
+            "time" : time.time(),
+            "python" : platform.python_version(),
+            "numpy" : np.__version__,
+            "platform" : platform.platform(),
+            "repeat" : args.repeat,
+            "scale" : args.scale,
+        },
+        "results" : results,
+    }
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent = 2, sort_keys = True)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for name, base, current, ratio in regressions:
+            print("REGRESSION {name}: {base:.6g} -> {current:.6g} ({ratio:.2f}x)".format(
+                name = name, base = base, current = current, ratio = ratio))
+        if len(regressions) > 0:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
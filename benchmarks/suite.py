@@ -0,0 +1,213 @@
+import os
+import sys
+import time
+import subprocess
+from os import path
+import numpy as np
+
+from referenceai.pipeline import Pipeline, PipelineAI
+from referenceai.dataset.idx import read_idx
+from referenceai.dataset.storage import ChunkedArray
+from .synthetic import SyntheticDataSource, SyntheticProvider, write_idx, mnist_like
+
+
+def timings(samples, unit = "s"):
+    samples = sorted(samples)
+    return {
+        "value" : float(np.median(samples)),
+        "min" : samples[0],
+        "mean" : sum(samples) / len(samples),
+        "repeat" : len(samples),
+        "unit" : unit,
+    }
+
+
+def measure(fn, repeat, setup = None):
+    """Median wall time of fn over repeat calls, setup runs untimed before each call."""
+    samples = []
+    for i in range(repeat):
+        arg = setup(i) if setup is not None else None
+        start = time.perf_counter()
+        fn(arg)
+        samples.append(time.perf_counter() - start)
+    return timings(samples)
+
+
+def throughput(fn, count, repeat, setup = None):
+    """Median items per second of fn over repeat calls that process count items each."""
+    samples = []
+    for i in range(repeat):
+        arg = setup(i) if setup is not None else None
+        start = time.perf_counter()
+        fn(arg)
+        samples.append(count / (time.perf_counter() - start))
+    return timings(samples, unit = "items/s")
+
+
+def chain(length):
+    """Ring of length int -> int stages, every stage adds a distinct offset
+    so no stage ever sees the input of another."""
+    def stage(offset):
+        def add(x: int) -> int:
+            return x + offset
+        return add
+    return [stage(k + 1) for k in range(length)]
+
+
+def cold(i):
+    # far enough apart that no stage of one run sees the inputs of another
+    return (i + 1) * 10 ** 6
+
+
+def bench_run_latency(repeat, scale):
+    p = Pipeline("bench-latency")
+    p.push("chain", chain(8), revise = False)
+    return {
+        "run.cold" : measure(lambda i: p.run("chain", i), repeat, setup = cold),
+        "run.cached" : measure(lambda _: p.run("chain", 0), repeat, setup = lambda i: p.run("chain", 0)),
+    }
+
+
+def bench_ring_length(repeat, scale):
+    results = {}
+    for length in (2, 8, 32, 128):
+        p = Pipeline("bench-length-{length}".format(length = length))
+        p.push("chain", chain(length), revise = False)
+        results["ring_length.{length}.cold".format(length = length)] = measure(
+            lambda i: p.run("chain", i), repeat, setup = cold)
+        results["ring_length.{length}.cached".format(length = length)] = measure(
+            lambda _: p.run("chain", 0), repeat, setup = lambda i: p.run("chain", 0))
+    return results
+
+
+def bench_provider_count(repeat, scale):
+    results = {}
+    for count in (1, 16, 128):
+        types = [type("Provided{k}".format(k = k), (int,), {}) for k in range(count)]
+        last = types[-1]
+
+        def consume(value: last) -> int:
+            return int(value)
+
+        def double(value: int) -> int:
+            return value * 2
+
+        p = Pipeline("bench-providers-{count}".format(count = count))
+        p.push("consume", [consume, double], revise = False)
+        results["providers.{count}".format(count = count)] = measure(
+            lambda args: p.run("consume", *args), repeat,
+            setup = lambda i: [t(i) for t in types])
+    return results
+
+
+def bench_serialization(repeat, scale):
+    results = {}
+    for entries in (16, 128 * scale):
+        def array(i: int) -> np.ndarray:
+            return np.full(1024, i, dtype = np.float64)
+
+        def total(a: np.ndarray) -> float:
+            return float(a.sum())
+
+        id = "bench-serialize-{entries}".format(entries = entries)
+        p = Pipeline(id, history = 0)
+        p.push("sum", [array, total], revise = False)
+        p.rings[0].cache.max_entries = 2 * entries
+        for i in range(entries):
+            p.run("sum", i)
+
+        # the first save writes every blob, later ones only the manifest
+        results["serialize.{entries}.first".format(entries = entries)] = measure(
+            lambda _: p.serialize(), repeat, setup = lambda i: p.store.clear())
+        results["serialize.{entries}.incremental".format(entries = entries)] = measure(
+            lambda _: p.serialize(), repeat)
+
+        def deserialize(_):
+            q = Pipeline(id, history = 0)
+            q.push("sum", [array, total], revise = False)
+            q.deserialize()
+        results["deserialize.{entries}".format(entries = entries)] = measure(deserialize, repeat)
+    return results
+
+
+def bench_idx(repeat, scale):
+    images, labels = mnist_like(10000 * scale)
+    filename = path.abspath("bench-images.idx")
+    write_idx(filename, images)
+    try:
+        return {
+            "idx.open" : measure(lambda _: read_idx(filename), repeat),
+            "idx.read" : measure(lambda _: np.asarray(read_idx(filename)[1]).sum(), repeat),
+        }
+    finally:
+        os.remove(filename)
+
+
+def bench_storage(repeat, scale):
+    images, _ = mnist_like(1000 * scale)
+    counter = iter(range(repeat * 2))
+
+    def append(array):
+        for image in images:
+            array.append(image)
+
+    def directory(i):
+        return ChunkedArray(path.abspath("bench-storage-{n}".format(n = next(counter))))
+
+    filled = directory(0)
+    append(filled)
+    indices = np.random.RandomState(0).randint(0, len(images), size = 256)
+    return {
+        "storage.append" : throughput(append, len(images), repeat, setup = directory),
+        "storage.gather" : throughput(lambda _: filled[indices], len(indices), repeat),
+    }
+
+
+def bench_classify(repeat, scale):
+    ds = SyntheticDataSource("bench-classify", count = 2000 * scale)
+    ai = PipelineAI("bench-classify", SyntheticProvider(ds), history = 0)
+    ai.train()
+
+    # every repeat classifies images the cache has not seen yet
+    def images(count):
+        return lambda i: mnist_like(count, seed = 1000 + i)[0]
+
+    def micro_batched(batch):
+        with ai.micro_batcher() as batcher:
+            [f.result() for f in [batcher.submit(image) for image in batch]]
+
+    return {
+        "classify.train" : measure(lambda _: ai.train(), repeat, setup = lambda i: ai.expunge("train")),
+        "classify.one" : throughput(lambda batch: [ai.classify(image) for image in batch], 64, repeat, setup = images(64)),
+        "classify.batch" : throughput(ai.classify_batch, 256, repeat, setup = images(256)),
+        "classify.micro_batcher" : throughput(micro_batched, 256, repeat, setup = images(256)),
+        "update.finetune" : measure(lambda image: ai.update(image, 3), repeat, setup = lambda i: images(1)(i)[0]),
+    }
+
+
+def bench_startup(repeat, scale):
+    """Time to import the core in a fresh interpreter, guards against
+    modules that pull in TensorFlow or Keras at import time."""
+    import referenceai
+    root = path.dirname(path.dirname(path.abspath(referenceai.__file__)))
+    env = dict(os.environ, PYTHONPATH = os.pathsep.join(p for p in (root, os.environ.get("PYTHONPATH")) if p))
+
+    def python(statement):
+        return lambda _: subprocess.check_call([sys.executable, "-c", statement], env = env)
+    return {
+        "startup.python" : measure(python("pass"), repeat),
+        "startup.pipeline" : measure(python("import referenceai.pipeline"), repeat),
+        "startup.servers" : measure(python("import referenceai.servers, referenceai.dataset.images.mnist"), repeat),
+    }
+
+
+BENCHMARKS = {
+    "startup" : bench_startup,
+    "run_latency" : bench_run_latency,
+    "ring_length" : bench_ring_length,
+    "provider_count" : bench_provider_count,
+    "serialization" : bench_serialization,
+    "idx" : bench_idx,
+    "storage" : bench_storage,
+    "classify" : bench_classify,
+}
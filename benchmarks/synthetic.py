@@ -0,0 +1,105 @@
+import numpy as np
+
+from referenceai.pipeline import PipelineAIProvider
+from referenceai.datasource import DataSource
+from referenceai.transform import Transform, CategoricalTransform
+
+
+def write_idx(filename, array):
+    """Writes a uint8 array as an IDX file."""
+    with open(filename, 'wb') as f:
+        f.write(bytes([0, 0, 0x08, array.ndim]))
+        f.write(np.array(array.shape, dtype = '>u4').tobytes())
+        f.write(np.ascontiguousarray(array, dtype = np.uint8).tobytes())
+
+
+def mnist_like(count, seed = 0):
+    """Random 28x28 uint8 images with one of ten labels, where every label
+    has its own mean intensity so the set is learnable."""
+    random = np.random.RandomState(seed)
+    labels = random.randint(0, 10, size = count).astype(np.uint8)
+    noise = random.randint(0, 32, size = (count, 28, 28))
+    images = (labels[:, None, None].astype(np.int64) * 22 + noise).astype(np.uint8)
+    return images, labels
+
+
+class SyntheticDataSource(DataSource):
+    def __init__(self, id, count = 10000, seed = 0, base_path = None):
+        super().__init__(id, base_path = base_path)
+        self.train = mnist_like(count, seed = seed)
+        self.test = mnist_like(max(1, count // 6), seed = seed + 1)
+
+    def train_set(self):
+        return self.train
+
+    def test_set(self):
+        return self.test
+
+
+class CentroidModel():
+    """Nearest centroid classifier, a NumPy stand-in for a neural network."""
+
+    def __init__(self):
+        self.centroids = None
+
+    def fit(self, x: np.ndarray, y: np.ndarray):
+        self.centroids = np.stack([x[y[:, k] > 0].mean(axis = 0) for k in range(y.shape[1])])
+        return self
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        distances = ((x[:, None, :] - self.centroids[None, :, :]) ** 2).sum(axis = 2)
+        return -distances
+
+
+class SyntheticProvider(PipelineAIProvider):
+    def __init__(self, ds: DataSource):
+        self.ds = ds
+
+    def hyperparameters(self) -> dict:
+        return {"classes" : 10}
+
+    def model(self) -> CentroidModel:
+        return CentroidModel()
+
+    def datasource(self) -> DataSource:
+        return self.ds
+
+    def transform(self, ds: DataSource) -> (DataSource, Transform):
+        return ds, CategoricalTransform().fit(np.arange(10))
+
+    def train(self, ds: DataSource, model: CentroidModel, hyperparameters: dict, t: Transform) -> (CentroidModel, Transform):
+        x, y = ds.train_set()
+        model.fit(self.transform_batch(x), t.forward_transform(y))
+        return model, t
+
+    def transform_one(self, image: np.ndarray) -> np.ndarray:
+        return self.transform_batch(np.asarray(image)[None])
+
+    def transform_batch(self, images: np.ndarray) -> np.ndarray:
+        images = np.asarray(images, dtype = np.float32)
+        return images.reshape(len(images), -1) / 255
+
+    def classify(self, model: CentroidModel, images: np.ndarray) -> np.ndarray:
+        return model.predict(images)
+
+    def inverse_transform_one(self, labels: np.ndarray, t: Transform) -> int:
+        return int(t.inverse_transform(labels)[0])
+
+    def inverse_transform_batch(self, labels: np.ndarray, t: Transform) -> list:
+        return [int(label) for label in t.inverse_transform(labels)]
+
+    def finetune(self, ds: DataSource, model: CentroidModel, hyperparameters: dict, t: Transform) -> (CentroidModel, Transform):
+        for x, y in ds.finetune_batches(10, 64):
+            x, y = self.transform_batch(x), t.forward_transform(y)
+            for k in np.flatnonzero(y.sum(axis = 0)):
+                model.centroids[k] = 0.9 * model.centroids[k] + 0.1 * x[y[:, k] > 0].mean(axis = 0)
+        ds.updates.commit()
+        return model, t
+
+    def updatesource(self, ds: DataSource, image: np.ndarray, label: int) -> DataSource:
+        ds.updates.append(image, label)
+        return ds
+
+    def updatesource_bulk(self, ds: DataSource, images: np.ndarray, labels: list) -> DataSource:
+        ds.updates.extend(images, labels)
+        return ds
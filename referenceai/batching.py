@@ -0,0 +1,116 @@
+import time
+from threading import Thread, Lock
+from queue import Queue, Empty
+from concurrent.futures import Future
+import numpy as np
+from loguru import logger
+
+
+class MicroBatcher():
+    """Groups concurrent single item requests into batched calls.
+
+    ``submit`` queues an item and returns a concurrent.futures.Future. A
+    worker thread takes the first queued item, keeps collecting items until
+    ``max_batch_size`` are queued or ``max_latency`` seconds passed, calls
+    ``fn`` once with the stacked items of each shape and resolves every
+    future with its element of the result. ``fn`` only runs on the
+    ``workers`` worker threads, one batch per worker at a time.
+    """
+
+    def __init__(self, fn, max_batch_size = 32, max_latency = 0.005, workers = 1):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.workers = workers
+        self.queue = Queue()
+        self.lock = Lock()
+        self.threads = []
+        self.closed = False
+
+    def start(self):
+        with self.lock:
+            if len(self.threads) == 0:
+                self.closed = False
+                self.threads = [Thread(target = self._work, daemon = True) for _ in range(self.workers)]
+                for thread in self.threads:
+                    thread.start()
+        return self
+
+    def close(self):
+        with self.lock:
+            threads = self.threads
+            self.threads = []
+            self.closed = True
+        for _ in threads:
+            self.queue.put(None)
+        for thread in threads:
+            thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.close()
+
+    def submit(self, item) -> Future:
+        if self.closed:
+            raise RuntimeError("MicroBatcher is closed")
+        self.start()
+        future = Future()
+        self.queue.put((item, future))
+        return future
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    def _collect(self):
+        first = self.queue.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self.queue.get(timeout = timeout)
+            except Empty:
+                break
+            if request is None:
+                # finish this batch, then stop
+                self.queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _work(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+
+            # items of different shapes can not be stacked, each shape gets
+            # its own call so a malformed item only fails its own group
+            groups = {}
+            for item, future in batch:
+                groups.setdefault(np.shape(item), []).append((item, future))
+            for group in groups.values():
+                self._call(group)
+
+    def _call(self, batch):
+        futures = [future for _, future in batch]
+        try:
+            results = self.fn(np.stack([item for item, _ in batch]))
+            if results is None or len(results) != len(batch):
+                raise RuntimeError("Batched call returned {results} for {count} items".format(
+                    results = None if results is None else len(results), count = len(batch)))
+        except Exception as e:
+            logger.exception(e)
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        for future, result in zip(futures, results):
+            future.set_result(result)
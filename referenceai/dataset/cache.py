@@ -0,0 +1,209 @@
+import os
+from os import path, makedirs
+import json
+import gzip
+import zlib
+import hashlib as hl
+from threading import Lock
+from urllib import request
+from urllib.error import HTTPError
+import numpy as np
+from loguru import logger
+
+CHUNK_SIZE = 1 << 20
+
+
+class IntegrityError(ValueError):
+    pass
+
+
+def sha256_file(filename):
+    m = hl.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            m.update(chunk)
+    return m.hexdigest()
+
+
+class DatasetCache():
+    """Downloaded and converted dataset files with an integrity manifest.
+
+    Files live under ``base_path`` (``.rai/dataset/<id>`` for a DataSource)
+    next to a JSON manifest that records the URL, size and sha256 of every
+    file. Downloads go to a ``.part`` file that is resumed with an HTTP Range
+    request after an interruption, are checked against the expected digest
+    and renamed into place only once complete, so a file listed in the
+    manifest is always whole. A part the server reports as complete is used
+    as is, and parts that are stale or fail to decompress are discarded. ``array`` keeps a ``.npy`` copy of parsed files:
+    warm loads memory-map it and skip decompression and header parsing.
+    """
+
+    manifest_filename = "manifest.json"
+
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self.manifest_path = path.join(base_path, self.manifest_filename)
+        self.lock = Lock()
+        self.manifest = None
+
+    def __getstate__(self):
+        # locks can not be pickled, the manifest is read again on demand
+        state = self.__dict__.copy()
+        del state['lock']
+        state['manifest'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = Lock()
+
+    def _path(self, name):
+        return path.join(self.base_path, name)
+
+    def _entries(self):
+        if self.manifest is None:
+            try:
+                with open(self.manifest_path) as f:
+                    self.manifest = json.load(f)
+            except (OSError, ValueError):
+                self.manifest = {}
+        return self.manifest
+
+    def _record(self, name, entry):
+        with self.lock:
+            manifest = dict(self._entries())
+            manifest[name] = entry
+            tmp = self.manifest_path + ".tmp"
+            with open(tmp, 'w') as f:
+                json.dump(manifest, f, indent = 2, sort_keys = True)
+            os.replace(tmp, self.manifest_path)
+            self.manifest = manifest
+
+    def entry(self, name):
+        """Manifest entry of name when its file is present and complete."""
+        entry = self._entries().get(name)
+        if entry is None:
+            return None
+        try:
+            if path.getsize(self._path(name)) != entry['size']:
+                return None
+        except OSError:
+            return None
+        return entry
+
+    def verify(self, name):
+        """Rehashes name and compares it with the manifest."""
+        entry = self.entry(name)
+        return entry is not None and sha256_file(self._path(name)) == entry['sha256']
+
+    def _download(self, url, part):
+        """Downloads url into part, resuming a previous partial download."""
+        offset = path.getsize(part) if path.exists(part) else 0
+        req = request.Request(url)
+        if offset > 0:
+            req.add_header('Range', 'bytes={offset}-'.format(offset = offset))
+
+        try:
+            response = request.urlopen(req)
+        except HTTPError as e:
+            if e.code != 416 or offset == 0:
+                raise
+            # nothing left past offset: the process died after the download
+            # finished, or the part is not a prefix of the file any more
+            total = e.headers.get('Content-Range', '').rpartition('/')[2]
+            e.close()
+            if total == str(offset):
+                return
+            logger.warning('Discarding partial download of {url}'.format(url = url))
+            os.remove(part)
+            return self._download(url, part)
+
+        with response:
+            mode = 'ab'
+            if offset > 0 and response.getcode() != 206:
+                # the server does not support ranges, start over
+                mode = 'wb'
+            elif offset > 0:
+                logger.info('Resuming {url} at {offset} bytes'.format(url = url, offset = offset))
+            with open(part, mode) as f:
+                for chunk in iter(lambda: response.read(CHUNK_SIZE), b''):
+                    f.write(chunk)
+
+    def fetch(self, url, name, sha256 = None, decompress = False):
+        """Returns the local path of name, downloading url when it is not
+        cached yet.
+
+        ``sha256`` is the expected digest of the downloaded bytes. With
+        ``decompress`` the download is gunzipped into place and the manifest
+        records the digest of the decompressed file.
+        """
+        filename = self._path(name)
+        if self.entry(name) is not None:
+            return filename
+
+        directory = path.dirname(filename)
+        if not path.exists(directory):
+            makedirs(directory)
+
+        part = filename + ".part"
+        logger.info('Downloading {url} to {path}'.format(url = url, path = filename))
+        self._download(url, part)
+
+        if sha256 is not None:
+            digest = sha256_file(part)
+            if digest != sha256:
+                os.remove(part)
+                raise IntegrityError('Download of {url} has sha256 {digest}, expected {sha256}'.format(
+                    url = url, digest = digest, sha256 = sha256))
+
+        if decompress:
+            tmp = filename + ".tmp"
+            m = hl.sha256()
+            try:
+                with gzip.open(part, 'rb') as f_in, open(tmp, 'wb') as f_out:
+                    for chunk in iter(lambda: f_in.read(CHUNK_SIZE), b''):
+                        m.update(chunk)
+                        f_out.write(chunk)
+                os.replace(tmp, filename)
+            except (OSError, EOFError, zlib.error):
+                # a corrupt part would otherwise be resumed forever
+                os.remove(part)
+                raise
+            finally:
+                if path.exists(tmp):
+                    os.remove(tmp)
+            os.remove(part)
+            digest = m.hexdigest()
+        else:
+            os.replace(part, filename)
+            digest = sha256 if sha256 is not None else sha256_file(filename)
+
+        self._record(name, {'url' : url, 'size' : path.getsize(filename), 'sha256' : digest})
+        return filename
+
+    def array(self, name, reader):
+        """Returns reader(path of name) through a memory-mapped .npy copy.
+
+        The copy is written on the first call and reused as long as the
+        source file has the digest it was converted from.
+        """
+        source = self.entry(name)
+        npy = name + ".npy"
+        cached = self.entry(npy)
+        if cached is not None and (source is None or cached.get('source') == source['sha256']):
+            return np.load(self._path(npy), mmap_mode = 'r')
+
+        array = reader(self._path(name))
+        tmp = self._path(npy) + ".tmp"
+        try:
+            with open(tmp, 'wb') as f:
+                np.save(f, np.asarray(array))
+            os.replace(tmp, self._path(npy))
+        finally:
+            if path.exists(tmp):
+                os.remove(tmp)
+        self._record(npy, {
+            'size' : path.getsize(self._path(npy)),
+            'sha256' : sha256_file(self._path(npy)),
+            'source' : None if source is None else source['sha256']})
+        return np.load(self._path(npy), mmap_mode = 'r')
@@ -0,0 +1,89 @@
+import gzip
+import numpy as np
+
+# IDX type codes (third byte of the magic number)
+IDX_DTYPES = {
+    0x08 : np.dtype(np.uint8),
+    0x09 : np.dtype(np.int8),
+    0x0B : np.dtype('>i2'),
+    0x0C : np.dtype('>i4'),
+    0x0D : np.dtype('>f4'),
+    0x0E : np.dtype('>f8'),
+}
+
+
+class IDXHeader():
+    """Parsed header of an IDX file (http://yann.lecun.com/exdb/mnist/)."""
+
+    def __init__(self, magic, dtype, shape):
+        self.magic = magic
+        self.dtype = dtype
+        self.shape = shape
+        self.offset = 4 * (len(shape) + 1)
+
+    @classmethod
+    def parse(cls, buffer, name = None):
+        """Decodes the magic number and every dimension from one read."""
+        if len(buffer) < 4:
+            raise ValueError('Invalid IDX file %s: truncated header' % name)
+        ndim = buffer[3]
+        if len(buffer) < 4 * (ndim + 1):
+            raise ValueError('Invalid IDX file %s: truncated header' % name)
+
+        words = np.frombuffer(buffer, dtype='>u4', count = ndim + 1)
+        magic = int(words[0])
+        if buffer[0] != 0 or buffer[1] != 0 or buffer[2] not in IDX_DTYPES:
+            raise ValueError('Invalid magic number %d in IDX file %s' % (magic, name))
+        return cls(magic, IDX_DTYPES[buffer[2]], tuple(int(d) for d in words[1:]))
+
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def is_gzip(filename):
+    with open(filename, 'rb') as f:
+        return f.read(2) == GZIP_MAGIC
+
+
+def _open(filename):
+    if is_gzip(filename):
+        return gzip.open(filename, 'rb')
+    return open(filename, 'rb')
+
+
+def read_idx_header(filename):
+    """Reads the header of a plain or gzip compressed IDX file."""
+    with _open(filename) as f:
+        # the largest header has 255 dimensions
+        return IDXHeader.parse(f.read(4 * 256), name = filename)
+
+
+def check_idx_header(header, magic, name = None):
+    if header.magic != magic:
+        raise ValueError('Invalid magic number %d in IDX file %s, expected %d' % (header.magic, name, magic))
+
+
+def read_idx(filename):
+    """Reads an IDX file and returns (header, array).
+
+    Plain files are mapped into memory: the array is a read-only np.memmap
+    view of the file with the shape of the header and nothing is read or
+    copied until the data is accessed. Gzip compressed files are decompressed
+    into memory in one pass, without an intermediate file.
+    """
+    if is_gzip(filename):
+        with gzip.open(filename, 'rb') as f:
+            buffer = f.read()
+        header = IDXHeader.parse(buffer, name = filename)
+        count = int(np.prod(header.shape))
+        if len(buffer) < header.offset + count * header.dtype.itemsize:
+            raise ValueError('Invalid IDX file %s: truncated data' % filename)
+        array = np.frombuffer(buffer, dtype = header.dtype, count = count, offset = header.offset)
+        return header, array.reshape(header.shape)
+
+    header = read_idx_header(filename)
+    if np.prod(header.shape) == 0:
+        return header, np.zeros(header.shape, dtype = header.dtype)
+    array = np.memmap(filename, dtype = header.dtype, mode = 'r',
+                      offset = header.offset, shape = header.shape)
+    return header, array
@@ -2,23 +2,23 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-import gzip
 import os
-import shutil
-import tempfile
-
-import keras
+import copy
+from functools import partial
 
 import numpy as np
-from six.moves import urllib
-import tensorflow as tf
 from abc import abstractmethod
-from referenceai.transform import Transform
+from referenceai.transform import Transform, CategoricalTransform
 from referenceai.pipeline import PipelineAIProvider, PipelineAI
 from referenceai.datasource import ImagesDataSource, ImageScheme, DataSource
-from referenceai.model.images.lenet5 import LeNet5
+from referenceai.dataset.idx import read_idx, check_idx_header
+from referenceai.utils.lazy import lazy_import, lazy_type
 from loguru import logger
-from sklearn.preprocessing import OneHotEncoder
+
+# Keras is only imported once a model is built or loaded
+keras = lazy_import("keras")
+lenet5 = lazy_import("referenceai.model.images.lenet5")
+Model = lazy_type("keras", "Model")
 
 class MNISTImagesDataSource(ImagesDataSource):
 
@@ -29,79 +29,54 @@ class MNISTImagesDataSource(ImagesDataSource):
         self.test_images_filename = '{id}_test_file'.format(id=id)
         self.test_labels_filename = '{id}_labels_file'.format(id=id)
 
-    def __read32(self,bytestream):
-        """Read 4 bytes from bytestream as an unsigned 32-bit integer."""
-        dt = np.dtype(np.uint32).newbyteorder('>')
-        return np.frombuffer(bytestream.read(4), dtype=dt)[0]
+    def __check_image_file_header(self, header, filename):
+        """Validate that filename corresponds to images for the MNIST dataset."""
+        check_idx_header(header, 2051, name = filename)
+        if header.shape[1:] != (28, 28):
+            raise ValueError(
+                'Invalid MNIST file %s: Expected 28x28 images, found %s' %
+                (filename, 'x'.join(str(d) for d in header.shape[1:])))
 
 
-    def __check_image_file_header(self, filename):
-        """Validate that filename corresponds to images for the MNIST dataset."""
-        with tf.gfile.Open(filename, 'rb') as f:
-            magic = self.__read32(f)
-            self.__read32(f)  # num_images, unused
-            rows = self.__read32(f)
-            cols = self.__read32(f)
-            if magic != 2051:
-                raise ValueError('Invalid magic number %d in MNIST file %s' % (magic,
-                                                                                f.name))
-            if rows != 28 or cols != 28:
-                raise ValueError(
-                    'Invalid MNIST file %s: Expected 28x28 images, found %dx%d' %
-                    (f.name, rows, cols))
-
-
-    def __check_labels_file_header(self, filename):
+    def __check_labels_file_header(self, header, filename):
         """Validate that filename corresponds to labels for the MNIST dataset."""
-        with tf.gfile.Open(filename, 'rb') as f:
-            magic = self.__read32(f)
-            self.__read32(f)  # num_items, unused
-            if magic != 2049:
-                raise ValueError('Invalid magic number %d in MNIST file %s' % (magic,
-                                                                            f.name))
-
-
-    def __download(self, directory, url, filename):
-        """Download (and unzip) a file from the MNIST dataset if not already done."""
-        filepath = os.path.join(directory, filename)
-        if tf.gfile.Exists(filepath):
-            return filepath
-        if not tf.gfile.Exists(directory):
-            tf.gfile.MakeDirs(directory)
-        _, zipped_filepath = tempfile.mkstemp(suffix='.gz')
-        print('Downloading %s to %s' % (url, zipped_filepath))
-        urllib.request.urlretrieve(url, zipped_filepath)
-        with gzip.open(zipped_filepath, 'rb') as f_in, \
-            tf.gfile.Open(filepath, 'wb') as f_out:
-            shutil.copyfileobj(f_in, f_out)
-        os.remove(zipped_filepath)
-        return filepath
+        check_idx_header(header, 2049, name = filename)
 
 
-    def dataset(self,directory, images_url, labels_url, images_file, labels_file):
-        """Download and parse MNIST dataset."""
+    def __read_images(self, filename):
+        header, images = read_idx(filename)
+        self.__check_image_file_header(header, filename)
+        return images
 
-        images_file = self.__download(directory, images_url, images_file)
-        labels_file = self.__download(directory, labels_url, labels_file)
+    def __read_labels(self, filename):
+        header, labels = read_idx(filename)
+        self.__check_labels_file_header(header, filename)
+        return labels
 
-        self.__check_image_file_header(images_file)
-        self.__check_labels_file_header(labels_file)
+    def dataset(self,directory, images_url, labels_url, images_file, labels_file):
+        """Download and parse MNIST dataset."""
 
-        labels = np.fromfile(labels_file, dtype='ubyte', offset=8)
-        images = np.fromfile(images_file, dtype='ubyte', offset=16)
-        images = np.split(images, len(labels))
-        def reshape2d(arr):
-            return np.reshape(arr, (28,28))
-        images = np.array(list(map(reshape2d,images)))
+        subset = os.path.relpath(directory, self.base_path)
+        images_file = os.path.join(subset, images_file)
+        labels_file = os.path.join(subset, labels_file)
+        self.cache.fetch(images_url, images_file, decompress = True)
+        self.cache.fetch(labels_url, labels_file, decompress = True)
+
+        # (N, 28, 28) and (N,) arrays memory-mapped from .npy copies, the
+        # IDX files are only parsed and validated the first time
+        images = self.cache.array(images_file, self.__read_images)
+        labels = self.cache.array(labels_file, self.__read_labels)
+        if images.shape[1:] != (28, 28) or len(images) != len(labels):
+            raise ValueError('Invalid MNIST dataset in %s' % directory)
         
         return images, labels
 
     def __download_train_set(self, images_url, labels_url):
-        """tf.data.Dataset object for MNIST training data."""
+        """Downloads and maps the MNIST training data."""
         self.train_images, self.train_labels = self.dataset(self.train_directory, images_url, labels_url, self.train_images_filename, self.train_labels_filename)
 
     def __download_test_set(self, images_url, labels_url):
-        """tf.data.Dataset object for MNIST test data."""
+        """Downloads and maps the MNIST test data."""
         self.test_images, self.test_labels = self.dataset(self.test_directory, images_url, labels_url, self.test_images_filename, self.test_labels_filename)
 
     def load_from_url(self, train_url:(str,str), test_url:(str,str) = None):
@@ -125,18 +100,9 @@ class MNISTImagesDataSource(ImagesDataSource):
     def test_set(self) -> (np.array, np.array):
         return self.test_images, self.test_labels
 
-class MNISTTransform(Transform):
-    def __init__(self):
-        self.encoder = OneHotEncoder()
-
-    def fit(self, data: np.ndarray):
-        self.encoder.fit(data)
-
-    def forward_transform(self, data: np.ndarray) -> np.ndarray:
-        return self.encoder.transform(data)
-
-    def inverse_transform(self, data: np.ndarray) -> np.ndarray:
-        return self.encoder.inverse_transform(data)
+class MNISTTransform(CategoricalTransform):
+    def __init__(self, dtype = np.float32):
+        super().__init__(dtype = dtype)
     
 
 class MNISTPipelineAIProvider(PipelineAIProvider):
@@ -150,7 +116,12 @@ class MNISTPipelineAIProvider(PipelineAIProvider):
             "epochs" : 5, 
             "batch_size": 128, 
             "optimizer" : 'sgd', 
-            'loss' : 'binary_crossentropy'}
+            'loss' : 'binary_crossentropy',
+            "streaming" : False,
+            "prefetch" : 4,
+            "workers" : 2,
+            "finetune_steps" : 10,
+            "replay" : 64}
 
     def datasource(self) -> ImagesDataSource: 
         return self.ds
@@ -168,22 +139,34 @@ class MNISTPipelineAIProvider(PipelineAIProvider):
         r = self._transform_images(np.array([image]))
         return r
 
-    def transform(self, ds: ImagesDataSource) -> (ImagesDataSource, Transform):
+    def _preprocess_batch(self, t: Transform, images: np.ndarray, labels: np.ndarray):
+        return self._transform_images(images), t.forward_transform(labels)
+
+    def transform_batch(self, images: np.ndarray) -> np.ndarray:
+        return self._transform_images(np.asarray(images))
+
+    def transform(self, ds: ImagesDataSource, hyperparameters: dict) -> (ImagesDataSource, Transform):
         train_images, train_image_labels = ds.train_set()
         test_images, test_image_labels = ds.test_set()
+
+        if hyperparameters.get("streaming", False):
+            # batches are decoded while training, only fit the label encoder here
+            t = MNISTTransform()
+            t.fit(train_image_labels)
+            return ds, t
         
         train_images = self._transform_images(train_images)
         test_images = self._transform_images(test_images)
         
-        test_image_labels = np.reshape(test_image_labels, (-1,1))
-        train_image_labels = np.reshape(train_image_labels, (-1,1))
-
         # let's now take the categorical values and convert them to one-hot encoding
         t = MNISTTransform()
-        t.encoder.fit(train_image_labels)
+        t.fit(train_image_labels)
         
-        train_image_labels_onehot = t.encoder.transform(train_image_labels).toarray()
-        test_image_labels_onehot = t.encoder.transform(test_image_labels).toarray()
+        train_image_labels_onehot = t.forward_transform(train_image_labels)
+        test_image_labels_onehot = t.forward_transform(test_image_labels)
+
+        # transform a copy, the raw data source is still used for updates
+        ds = copy.copy(ds)
         ds.train_images = train_images
         ds.train_labels = train_image_labels_onehot
         ds.test_images = test_images
@@ -192,39 +175,51 @@ class MNISTPipelineAIProvider(PipelineAIProvider):
         return ds, t
     
     def inverse_transform_one(self, labels : np.ndarray, t : Transform) -> int:
-        labels = labels[0]
-        idx = labels.tolist().index(max(labels))
-        labels = [0]*len(labels)
-        labels[idx] = 1
-        return int(t.encoder.inverse_transform([labels])[0][0])
+        return int(t.inverse_transform(labels)[0])
 
-    def model(self) -> keras.Model:
+    def inverse_transform_batch(self, labels : np.ndarray, t : Transform) -> list:
+        return [int(label) for label in t.inverse_transform(labels)]
+
+    def model(self) -> Model:
         # 2d 28*28 for MNIST dataset
-        return LeNet5.model((28,28))
+        return lenet5.LeNet5.model((28,28))
 
     def train(self, ds: ImagesDataSource, 
-                    model: keras.Model,  
+                    model: Model,  
                     hyperparameters: dict,
-                    transform: Transform) -> (keras.Model, Transform):
+                    transform: Transform) -> (Model, Transform):
                     
-        return LeNet5.train(model, ds, hyperparameters), transform
-
-    def save(self, model: keras.Model):
+        preprocess = None
+        if hyperparameters.get("streaming", False):
+            preprocess = partial(self._preprocess_batch, transform)
+        return lenet5.LeNet5.train(model, ds, hyperparameters, preprocess = preprocess), transform
+
+    def finetune(self, ds: ImagesDataSource,
+                       model: Model,
+                       hyperparameters: dict,
+                       transform: Transform) -> (Model, Transform):
+        # only the new samples and the replayed ones are transformed
+        batches = ds.finetune_batches(hyperparameters["finetune_steps"], hyperparameters["replay"])
+        model = lenet5.LeNet5.finetune(model, batches, partial(self._preprocess_batch, transform))
+        ds.updates.commit()
+        return model, transform
+
+    def save(self, model: Model):
         return model.save("mnist_lenet5.hd5")
 
-    def load(self, model: keras.Model) -> keras.Model:
+    def load(self, model: Model) -> Model:
         return keras.models.load_model("mnist_lenet5.hd5")
 
-    def classify(self, model: keras.Model, image: np.ndarray) -> np.ndarray:
+    def classify(self, model: Model, image: np.ndarray) -> np.ndarray:
         prediction = model.predict(image)
         return prediction
 
-    def updatesource(self, ds: ImagesDataSource, image: np.ndarray, classification: str) -> ImagesDataSource:
-        # TODO: Update the images data source with new image
+    def updatesource(self, ds: ImagesDataSource, image: np.ndarray, classification: int) -> ImagesDataSource:
+        ds.updates.append(image, classification)
         return ds
 
-    def updatesource_bulk(self, ds: ImagesDataSource, images: np.ndarray, classifications: [str]) -> ImagesDataSource:
-        # TODO: Update the images data source with new images
+    def updatesource_bulk(self, ds: ImagesDataSource, images: np.ndarray, classifications: list) -> ImagesDataSource:
+        ds.updates.extend(images, classifications)
         return ds
 
 class MNIST(PipelineAI):
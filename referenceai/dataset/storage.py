@@ -0,0 +1,206 @@
+import os
+from os import path, makedirs
+import json
+from numbers import Integral
+import numpy as np
+
+
+def _check_rows(rows, row_shape, dtype):
+    rows = np.asarray(rows)
+    if dtype is None:
+        return rows
+    if rows.shape[1:] != row_shape:
+        raise ValueError('Expected rows of shape {expected}, got {shape}'.format(
+            expected = row_shape, shape = rows.shape[1:]))
+    if not np.can_cast(rows.dtype, dtype, casting = 'same_kind'):
+        raise ValueError('Expected rows of {expected}, got {dtype}'.format(
+            expected = dtype, dtype = rows.dtype))
+    return rows
+
+
+class GrowableArray():
+    """In-memory array of rows whose capacity doubles when full, so appends
+    are amortized O(1)."""
+
+    def __init__(self, capacity = 16):
+        self.capacity = capacity
+        self.data = None
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def row_shape(self):
+        return None if self.data is None else self.data.shape[1:]
+
+    @property
+    def dtype(self):
+        return None if self.data is None else self.data.dtype
+
+    def check(self, rows):
+        """Raises ValueError unless rows can be appended as they are."""
+        return _check_rows(rows, self.row_shape, self.dtype)
+
+    def extend(self, rows):
+        rows = self.check(rows)
+        if self.data is None:
+            self.data = np.empty((max(self.capacity, len(rows)),) + rows.shape[1:], dtype = rows.dtype)
+        elif self.count + len(rows) > len(self.data):
+            data = np.empty((max(2 * len(self.data), self.count + len(rows)),) + self.data.shape[1:], dtype = self.data.dtype)
+            data[:self.count] = self.data[:self.count]
+            self.data = data
+        self.data[self.count:self.count + len(rows)] = rows
+        self.count += len(rows)
+
+    def append(self, row):
+        self.extend(np.asarray(row)[None])
+
+    def __getitem__(self, key):
+        if self.data is None:
+            raise IndexError(key)
+        return self.data[:self.count][key]
+
+    def __array__(self, dtype = None):
+        return np.asarray(self[:], dtype = dtype)
+
+
+class ChunkedArray():
+    """Append-only array of rows stored in fixed-size chunk files.
+
+    Rows are written into ``chunk_size`` row .npy files in ``directory``,
+    memory-mapped on first access, next to a small JSON file with the row
+    shape, dtype and count. Appends only ever touch the last chunk, so they
+    are O(1) and never copy what was stored before; ``len`` reads the count
+    from the metadata without loading any rows. Integer, slice and index
+    array lookups read only the chunks they hit. The count is written after
+    the rows, so a process that dies mid-append loses that append but never
+    exposes rows that were not written; ``flush`` also syncs the chunks to
+    disk.
+    """
+
+    meta_filename = "meta.json"
+
+    def __init__(self, directory, chunk_size = 4096):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.row_shape = None
+        self.dtype = None
+        self.count = 0
+        self.chunks = {}
+
+        meta_path = path.join(directory, self.meta_filename)
+        if path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            self.chunk_size = meta['chunk_size']
+            self.row_shape = tuple(meta['row_shape'])
+            self.dtype = np.dtype(meta['dtype'])
+            self.count = meta['count']
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def shape(self):
+        return (self.count,) + (self.row_shape or ())
+
+    def _chunk_path(self, i):
+        return path.join(self.directory, "chunk-{i:06d}.npy".format(i = i))
+
+    def _chunk(self, i, create = False):
+        chunk = self.chunks.get(i)
+        if chunk is None:
+            if create:
+                chunk = np.lib.format.open_memmap(self._chunk_path(i), mode = 'w+', dtype = self.dtype,
+                                                  shape = (self.chunk_size,) + self.row_shape)
+            else:
+                chunk = np.load(self._chunk_path(i), mmap_mode = 'r+')
+            self.chunks[i] = chunk
+        return chunk
+
+    def _save_meta(self):
+        meta_path = path.join(self.directory, self.meta_filename)
+        tmp = meta_path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'chunk_size' : self.chunk_size,
+                       'row_shape' : list(self.row_shape),
+                       'dtype' : self.dtype.str,
+                       'count' : self.count}, f)
+        os.replace(tmp, meta_path)
+
+    def check(self, rows):
+        """Raises ValueError unless rows can be appended as they are."""
+        return _check_rows(rows, self.row_shape, self.dtype)
+
+    def extend(self, rows):
+        rows = self.check(rows)
+        if self.dtype is None:
+            if not path.exists(self.directory):
+                makedirs(self.directory)
+            self.row_shape = rows.shape[1:]
+            self.dtype = rows.dtype
+
+        written = 0
+        while written < len(rows):
+            i, offset = divmod(self.count + written, self.chunk_size)
+            chunk = self._chunk(i, create = offset == 0)
+            n = min(self.chunk_size - offset, len(rows) - written)
+            chunk[offset:offset + n] = rows[written:written + n]
+            written += n
+
+        self.count += written
+        self._save_meta()
+
+    def flush(self):
+        for chunk in self.chunks.values():
+            chunk.flush()
+
+    def append(self, row):
+        self.extend(np.asarray(row)[None])
+
+    def __getitem__(self, key):
+        if isinstance(key, Integral):
+            idx = key + self.count if key < 0 else key
+            if idx < 0 or idx >= self.count:
+                raise IndexError(key)
+            i, offset = divmod(idx, self.chunk_size)
+            return self._chunk(i)[offset]
+
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.count)
+            if step == 1:
+                parts = []
+                while start < stop:
+                    i, offset = divmod(start, self.chunk_size)
+                    n = min(self.chunk_size - offset, stop - start)
+                    parts.append(self._chunk(i)[offset:offset + n])
+                    start += n
+                if len(parts) == 1:
+                    return np.array(parts[0])
+                if len(parts) == 0:
+                    return np.empty((0,) + (self.row_shape or ()), dtype = self.dtype)
+                return np.concatenate(parts)
+            key = np.arange(start, stop, step)
+
+        indices = np.asarray(key)
+        if indices.dtype == bool:
+            indices = np.flatnonzero(indices)
+        indices = np.where(indices < 0, indices + self.count, indices)
+        if np.any((indices < 0) | (indices >= self.count)):
+            raise IndexError(key)
+        out = np.empty(indices.shape + self.row_shape, dtype = self.dtype)
+        chunks = indices // self.chunk_size
+        for i in np.unique(chunks):
+            mask = chunks == i
+            out[mask] = self._chunk(int(i))[indices[mask] % self.chunk_size]
+        return out
+
+    def __array__(self, dtype = None):
+        return np.asarray(self[:], dtype = dtype)
+
+    def __getstate__(self):
+        # chunks are mapped again on demand
+        state = self.__dict__.copy()
+        state['chunks'] = {}
+        return state
@@ -1,9 +1,196 @@
 import os
+import json
 from os import path
-from urllib import request
 from abc import abstractmethod
 import numpy as np
 from enum import Enum
+from queue import Queue
+from threading import Thread
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from .dataset.cache import DatasetCache
+from .dataset.storage import GrowableArray, ChunkedArray
+
+class Epochs():
+    """Base of iterables whose every ``iter`` is one epoch of batches."""
+
+    def repeat(self):
+        """Endless generator over epochs, as expected by generator-based training."""
+        while True:
+            for batch in self:
+                yield batch
+
+class BatchIterator(Epochs):
+    """Iterates over (x, y) batches of two indexable arrays of equal length.
+
+    Every epoch (every call to ``iter``) visits the samples in a new random
+    order when ``shuffle`` is set. Batches are read one at a time with sorted
+    indices, so memory-mapped arrays only page in the rows of the current
+    batch. With ``prefetch`` > 0 a background thread reads up to that many
+    batches ahead of the consumer.
+    """
+
+    def __init__(self, x, y, batch_size = 128, shuffle = True, seed = None, prefetch = 0):
+        self.x = x
+        self.y = y
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.prefetch = prefetch
+        self.random = np.random.RandomState(seed)
+        self.order = np.arange(len(x))
+        self.reshuffle()
+
+    def reshuffle(self):
+        if self.shuffle:
+            self.random.shuffle(self.order)
+
+    def __len__(self):
+        return (len(self.order) + self.batch_size - 1) // self.batch_size
+
+    def __getitem__(self, idx):
+        if idx < 0 or idx >= len(self):
+            raise IndexError(idx)
+        indices = np.sort(self.order[idx * self.batch_size:(idx + 1) * self.batch_size])
+        return np.asarray(self.x[indices]), np.asarray(self.y[indices])
+
+    def _epoch(self):
+        for idx in range(len(self)):
+            yield self[idx]
+        self.reshuffle()
+
+    def _prefetched(self):
+        done = object()
+        errors = []
+        queue = Queue(maxsize = self.prefetch)
+
+        def fill():
+            try:
+                for batch in self._epoch():
+                    queue.put(batch)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                queue.put(done)
+
+        Thread(target = fill, daemon = True).start()
+        while True:
+            batch = queue.get()
+            if batch is done:
+                if len(errors) > 0:
+                    raise errors[0]
+                return
+            yield batch
+
+    def __iter__(self):
+        if self.prefetch > 0:
+            return self._prefetched()
+        return self._epoch()
+
+class PrefetchLoader(Epochs):
+    """Preprocesses upcoming batches on a pool of workers.
+
+    Wraps a BatchIterator and keeps up to ``depth`` batches in flight, each
+    read and passed through ``preprocess(x, y) -> (x, y)`` (decode, normalize,
+    encode labels, ...) on one of ``workers`` threads, while the consumer is
+    busy with the current batch. Batches are yielded in iterator order. With a
+    ProcessPoolExecutor batches are read on the calling thread and only the
+    preprocessing is shipped to the worker processes.
+    """
+
+    def __init__(self, batches: BatchIterator, preprocess = None, depth = 4, workers = 2, executor = None):
+        self.batches = batches
+        self.preprocess = preprocess
+        self.depth = depth
+        self.workers = workers
+        self.executor = executor
+
+    def __len__(self):
+        return len(self.batches)
+
+    def _load(self, idx):
+        x, y = self.batches[idx]
+        if self.preprocess is not None:
+            x, y = self.preprocess(x, y)
+        return x, y
+
+    def _submit(self, executor, idx):
+        if isinstance(executor, ProcessPoolExecutor):
+            x, y = self.batches[idx]
+            if self.preprocess is None:
+                return executor.submit(tuple, (x, y))
+            return executor.submit(self.preprocess, x, y)
+        return executor.submit(self._load, idx)
+
+    def __iter__(self):
+        executor = self.executor
+        owned = executor is None
+        if owned:
+            executor = ThreadPoolExecutor(max_workers = self.workers)
+
+        try:
+            pending = deque()
+            for idx in range(len(self)):
+                pending.append(self._submit(executor, idx))
+                if len(pending) >= self.depth:
+                    yield pending.popleft().result()
+            while len(pending) > 0:
+                yield pending.popleft().result()
+            self.batches.reshuffle()
+        finally:
+            if owned:
+                executor.shutdown(wait = False)
+
+class UpdateBuffer():
+    """Append-only store of labeled samples added after the dataset was loaded.
+
+    Samples and labels are kept in two row stores with amortized O(1)
+    appends, in memory by default or on disk with ChunkedArrays. ``trained``
+    counts the samples a model was already fine-tuned on: ``pending``
+    returns the others and ``commit`` marks them as trained. With
+    ``state_path`` the count is kept in that JSON file, so samples stored on
+    disk are not fine-tuned on again after a restart.
+    """
+
+    def __init__(self, x = None, y = None, state_path = None):
+        self.x = GrowableArray() if x is None else x
+        self.y = GrowableArray() if y is None else y
+        self.state_path = state_path
+        self.trained = 0
+        if state_path is not None and path.exists(state_path):
+            with open(state_path) as f:
+                self.trained = json.load(f)['trained']
+
+    def __len__(self):
+        return len(self.x)
+
+    def append(self, x, y):
+        self.extend(np.asarray(x)[None], np.asarray(y)[None])
+
+    def extend(self, xs, ys):
+        xs, ys = np.asarray(xs), np.asarray(ys)
+        if len(xs) != len(ys):
+            raise ValueError('Got {x} samples and {y} labels'.format(x = len(xs), y = len(ys)))
+        # a sample must never be stored without its label, or the other way around
+        xs, ys = self.x.check(xs), self.y.check(ys)
+        self.x.extend(xs)
+        self.y.extend(ys)
+
+    def samples(self, start = 0, stop = None) -> (np.ndarray, np.ndarray):
+        if len(self) == 0:
+            return None, None
+        stop = len(self) if stop is None else min(stop, len(self))
+        return self.x[start:stop], self.y[start:stop]
+
+    def pending(self) -> (np.ndarray, np.ndarray):
+        return self.samples(self.trained)
+
+    def commit(self, count = None):
+        self.trained = len(self) if count is None else count
+        if self.state_path is not None:
+            tmp = self.state_path + ".tmp"
+            with open(tmp, 'w') as f:
+                json.dump({'trained' : self.trained}, f)
+            os.replace(tmp, self.state_path)
 
 class DataSource():
 
@@ -21,16 +208,17 @@ class DataSource():
         if not path.exists(self.base_path):
             os.makedirs(self.base_path)
 
+        # downloads and converted files, with their digests
+        self.cache = DatasetCache(self.base_path)
+        self.updates = UpdateBuffer()
+
     @abstractmethod
     def load(self, train_url: str, test_url = None) -> str:
-        base_path = os.path.join(self.base_path, self.id)
-        if not path.exists(base_path):
-            # download and store files
-            os.makedirs(path.join(base_path, "train"))
-            request.urlretrieve(train_url, path.join(base_path,"train"))
-            if test_url is not None:
-                os.makedirs(path.join(base_path, "test"))
-                request.urlretrieve(test_url, path.join(base_path, "test"))
+        # download and store files, already cached ones are not fetched again
+        self.cache.fetch(train_url, path.join("train", path.basename(train_url)))
+        if test_url is not None:
+            self.cache.fetch(test_url, path.join("test", path.basename(test_url)))
+        return self.base_path
 
     @abstractmethod
     def train_set(self) -> np.array:
@@ -40,6 +228,42 @@ class DataSource():
     def test_set(self) -> np.array:
         pass
 
+    def replay(self, count, random = None) -> (np.ndarray, np.ndarray):
+        """Random sample of count train set and already trained update samples."""
+        random = np.random if random is None else random
+        x, y = self.train_set()
+        total = len(x) + self.updates.trained
+        indices = np.sort(random.choice(total, size = min(count, total), replace = False))
+        old = indices[indices < len(x)]
+        xs, ys = [np.asarray(x[old])], [np.asarray(y[old])]
+        if len(old) < len(indices):
+            bx, by = self.updates.samples(0, self.updates.trained)
+            xs.append(bx[indices[len(old):] - len(x)])
+            ys.append(by[indices[len(old):] - len(x)])
+        return np.concatenate(xs), np.concatenate(ys)
+
+    def finetune_batches(self, steps, replay, seed = None):
+        """Yields steps (x, y) batches of the pending update samples, each
+        mixed with a fresh replay sample of the data trained on before so
+        fine-tuning does not forget it. Nothing is transformed here."""
+        random = np.random.RandomState(seed)
+        x, y = self.updates.pending()
+        if x is None or len(x) == 0:
+            return
+        for _ in range(steps):
+            rx, ry = self.replay(replay, random)
+            yield np.concatenate([x, rx.astype(x.dtype, copy = False)]), np.concatenate([y, ry.astype(y.dtype, copy = False)])
+
+    def batches(self, subset = 'train', batch_size = 128, shuffle = True, seed = None, prefetch = 0) -> BatchIterator:
+        """Batches of the train or test set without materializing either."""
+        if subset == 'train':
+            x, y = self.train_set()
+        elif subset == 'test':
+            x, y = self.test_set()
+        else:
+            raise ValueError('Unknown subset {subset}, expected train or test'.format(subset = subset))
+        return BatchIterator(x, y, batch_size = batch_size, shuffle = shuffle, seed = seed, prefetch = prefetch)
+
 class Image(np.ndarray):
     pass
 
@@ -70,6 +294,14 @@ class ImagesDataSource(DataSource):
         elif type is ImageScheme.HVS:
             self.num_channels = 3
 
+        # images added after loading are appended to chunk files on disk
+        updates_path = path.join(self.base_path, "updates")
+        if not path.exists(updates_path):
+            os.makedirs(updates_path)
+        self.updates = UpdateBuffer(ChunkedArray(path.join(updates_path, "images")),
+                                    ChunkedArray(path.join(updates_path, "labels")),
+                                    state_path = path.join(updates_path, "state.json"))
+
     def load_from_url(self, train_url: (str,str), test_url: (str,str)) -> str:
         super.load_from_url(train_url, test_url = test_url)
     
@@ -89,10 +321,12 @@ class ImagesDataSource(DataSource):
     def images(self):
         pass
 
-    @abstractmethod
     def image(self, idx):
-        pass
+        """Image idx of the train set followed by the added images."""
+        x, _ = self.train_set()
+        if idx < len(x):
+            return x[idx]
+        return self.updates.x[idx - len(x)]
 
-    @abstractmethod
     def num_images(self):
-        pass
+        return len(self.train_set()[0]) + len(self.updates)
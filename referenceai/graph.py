@@ -5,6 +5,367 @@ import hashlib as hl
 import inspect
 from functools import reduce
 import numpy as np
+import sys
+from collections import OrderedDict, ChainMap
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from threading import RLock
+import time
+from functools import partial
+import asyncio
+from .fingerprint import fingerprint
+from .store import Segment, LazyValue, type_of
+
+
+def cacheable(key):
+    """Executions consuming a value without fingerprint are never cached."""
+    return None not in key[1]
+
+
+def output_fingerprint(key, idx):
+    """Fingerprint of the idx-th output of the edge execution cached under key,
+    None when the execution can not be cached."""
+    if not cacheable(key):
+        return None
+    m = hl.sha256()
+    m.update(repr((key, idx)).encode('utf-8'))
+    return m.hexdigest()
+
+
+class EdgeCache():
+    """Content addressed store of edge outputs.
+
+    Entries are keyed by ``(fn signature, input fingerprints)``, with
+    signatures from a SignatureRegistry, so outputs of earlier calls stay
+    valid when the ring arguments change, and are evicted least recently
+    used first once ``max_entries`` or ``max_bytes`` is exceeded. Outputs
+    are sized with the arrays they hold, also inside containers and object
+    attributes. The latest entry of every edge is pinned with ``pin`` and
+    never evicted, so rings that are not run for a while, such as the
+    prefixes producers run again, keep their last outputs. The fingerprints
+    consumed by every entry are indexed so ``invalidate`` can drop exactly
+    the entries downstream of a changed value.
+    """
+
+    def __init__(self, max_entries = 256, max_bytes = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.consumers = {}
+        self.pins = {}  # edge -> key of its latest entry
+        self.nbytes = 0
+
+    def _sizeof(self, outputs):
+        seen = set()
+        return sum(self._measure(o, 4, seen) for o in outputs)
+
+    def _measure(self, value, depth, seen):
+        if id(value) in seen:
+            return 0
+        seen.add(id(value))
+
+        if isinstance(value, np.ndarray):
+            # memory mapped arrays are backed by files, not by memory
+            if isinstance(value, np.memmap) or isinstance(value.base, np.memmap):
+                return sys.getsizeof(value)
+            return value.nbytes
+        size = sys.getsizeof(value)
+        if depth == 0:
+            return size
+        if isinstance(value, dict):
+            items = list(value.keys()) + list(value.values())
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            items = value
+        elif hasattr(value, '__dict__') and not isinstance(value, type):
+            items = vars(value).values()
+        else:
+            items = ()
+        for item in items:
+            size += self._measure(item, depth - 1, seen)
+        return size
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        outputs = self.entries.get(key)
+        if outputs is not None:
+            if isinstance(outputs, Segment):
+                try:
+                    outputs = outputs.load()
+                except Exception as e:
+                    logger.warning("Dropping unreadable cache entry {path}: {error}".format(path = outputs.path, error = e))
+                    self.invalidate(keys = [key])
+                    return None
+                self.entries[key] = outputs
+            self.entries.move_to_end(key)
+        return outputs
+
+    def restore(self, key, segment, size):
+        """Adds an entry persisted by a SegmentStore without reading it."""
+        self.pop(key)
+        self.entries[key] = segment
+        self.sizes[key] = size
+        self.nbytes += size
+        _, fingerprints = key
+        for fp in fingerprints:
+            self.consumers.setdefault(fp, set()).add(key)
+        self._evict()
+
+    def put(self, key, outputs):
+        self.pop(key)
+        self.entries[key] = outputs
+        self.sizes[key] = self._sizeof(outputs)
+        self.nbytes += self.sizes[key]
+        _, fingerprints = key
+        for fp in fingerprints:
+            self.consumers.setdefault(fp, set()).add(key)
+        self._evict()
+
+    def pop(self, key):
+        outputs = self.entries.pop(key, None)
+        if outputs is None:
+            return None
+
+        self.nbytes -= self.sizes.pop(key)
+        _, fingerprints = key
+        for fp in fingerprints:
+            keys = self.consumers.get(fp)
+            if keys is not None:
+                keys.discard(key)
+                if len(keys) == 0:
+                    del self.consumers[fp]
+        return outputs
+
+    def invalidate(self, keys = (), fingerprints = ()):
+        """Drop the given entries, the entries consuming the given fingerprints
+        and, transitively, every entry consuming their outputs. Returns the
+        fingerprints of the dropped outputs."""
+        keys = list(keys)
+        fingerprints = list(fingerprints)
+        dropped = set()
+
+        while len(keys) > 0 or len(fingerprints) > 0:
+            if len(fingerprints) > 0:
+                keys.extend(self.consumers.get(fingerprints.pop(), ()))
+                continue
+
+            key = keys.pop()
+            outputs = self.pop(key)
+            if outputs is not None:
+                produced = [output_fingerprint(key, i) for i in range(len(outputs))]
+                dropped.update(produced)
+                fingerprints.extend(produced)
+
+        return dropped
+
+    def pin(self, edge, key):
+        """Protects key, the latest entry of edge, from eviction."""
+        self.pins[edge] = key
+
+    def _evict(self):
+        pinned = set(self.pins.values())
+        while ((self.max_entries is not None and len(self.entries) > self.max_entries) or
+               (self.max_bytes is not None and self.nbytes > self.max_bytes)):
+            victim = next((key for key in self.entries if key not in pinned), None)
+            # always keep the most recent entry, even if it alone exceeds max_bytes
+            if victim is None or victim == next(reversed(self.entries)):
+                break
+            self.pop(victim)
+
+    def clear(self):
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.consumers = {}
+        self.pins = {}
+        self.nbytes = 0
+
+
+class SignatureRegistry():
+    """Memoizes the source fingerprint of the functions pushed on a GraphRing.
+
+    Source fingerprints are keyed on the function's code object, so ``run()``
+    only pays for a dictionary lookup. Functions sharing their code can still
+    behave differently: bound methods through their instance and closures
+    through their cells. Their signature is suffixed with the registration
+    number of the instance or closure, so every instance gets its own cache
+    entries while all bound methods of one provider share its number. The
+    numbers follow the push order and stay stable across restarts of a
+    program that pushes the same rings. Call ``invalidate`` after reloading a
+    module whose functions should be fingerprinted again.
+    """
+
+    def __init__(self):
+        self.signatures = {}
+        self.owners = {}  # id(instance or closure) -> (instance or closure, number)
+
+    def _key(self, fn):
+        fn = getattr(fn, '__func__', fn)
+        return getattr(fn, '__code__', fn)
+
+    def _owner(self, fn):
+        owner = getattr(fn, '__self__', None)
+        if owner is not None and not inspect.ismodule(owner):
+            return owner
+        if getattr(fn, '__closure__', None):
+            return fn
+        return None
+
+    def _compute(self, fn):
+        m = hl.sha256()
+        try:
+            m.update(inspect.getsource(fn).encode('utf-8'))
+        except (OSError, TypeError):
+            # no source available (REPL, builtins), fall back to the bytecode
+            code = self._key(fn)
+            m.update(getattr(code, 'co_code', repr(code).encode('utf-8')))
+        return m.hexdigest()
+
+    def register(self, fn):
+        key = self._key(fn)
+        if key not in self.signatures:
+            self.signatures[key] = self._compute(fn)
+        signature = self.signatures[key]
+
+        owner = self._owner(fn)
+        if owner is None:
+            return signature
+        # the owner is referenced so its id is never reused by another object
+        entry = self.owners.get(id(owner))
+        if entry is None:
+            entry = self.owners[id(owner)] = (owner, len(self.owners))
+        return '{signature}@{number}'.format(signature = signature, number = entry[1])
+
+    def __getitem__(self, fn):
+        return self.register(fn)
+
+    def invalidate(self, fn = None):
+        # registration numbers identify instances, not sources, and are kept
+        if fn is None:
+            self.signatures = {}
+        else:
+            self.signatures.pop(self._key(fn), None)
+
+    def __getstate__(self):
+        # code objects can not be pickled, fingerprints are recomputed on demand
+        return {'signatures' : {}, 'owners' : {}}
+
+
+class ProviderRegistry():
+    """Values available as edge function arguments during a ring run.
+
+    Mirrors a list where ``push`` inserts at the front and ``append`` at the
+    back: ``find`` returns the front-most value whose type is a subclass of
+    the requested one. Only the highest priority value of each concrete type
+    can ever be returned, so values are indexed by exact type and the
+    concrete types satisfying a requested type are resolved once per run.
+    """
+
+    def __init__(self):
+        self.by_type = {}   # concrete type -> (priority, value, fingerprint)
+        self.resolved = {}  # requested type -> concrete types subclassing it
+        self.top = 0
+        self.bottom = 0
+
+    def _add(self, priority, value, fp):
+        value_type = type_of(value)
+        prior = self.by_type.get(value_type)
+        if prior is None:
+            for requested, types in self.resolved.items():
+                if issubclass(value_type, requested):
+                    types.append(value_type)
+        elif prior[0] > priority:
+            return
+        self.by_type[value_type] = (priority, value, fp)
+
+    def push(self, value, fp):
+        self.top += 1
+        self._add(self.top, value, fp)
+
+    def append(self, value, fp):
+        self.bottom -= 1
+        self._add(self.bottom, value, fp)
+
+    def __contains__(self, value_type):
+        return value_type in self.by_type
+
+    def copy(self):
+        registry = ProviderRegistry()
+        registry.by_type = dict(self.by_type)
+        registry.top = self.top
+        registry.bottom = self.bottom
+        return registry
+
+    def find(self, requested):
+        """Returns (value, fingerprint) of the front-most match, or None."""
+        types = self.resolved.get(requested)
+        if types is None:
+            types = [t for t in self.by_type if issubclass(t, requested)]
+            self.resolved[requested] = types
+
+        if len(types) == 1:
+            best = self.by_type[types[0]]
+        else:
+            best = None
+            for t in types:
+                candidate = self.by_type[t]
+                if best is None or candidate[0] > best[0]:
+                    best = candidate
+            if best is None:
+                return None
+
+        value = best[1]
+        if isinstance(value, LazyValue):
+            # restored root outputs are only read once a ring needs them
+            value = value.get()
+        return value, best[2]
+
+
+class Step():
+    """A compiled edge of a ring.
+
+    Holds the edge function with its memoized signature, its annotated input
+    and output types and, for every input, the ``(step, output)`` slot of the
+    ring it is read from when an earlier step is known to produce it.
+    Inputs without a slot are resolved from the ProviderRegistry. ``deps``
+    are the earlier steps that must complete before this one can start.
+    """
+
+    __slots__ = ('edge', 'fn', 'signature', 'inputs', 'outputs', 'slots', 'deps')
+
+    def __init__(self, edge, fn, signature):
+        self.edge = edge
+        self.fn = fn
+        self.signature = signature
+
+        annotations = fn.__annotations__.copy()
+        outputs = annotations.pop('return', None)
+        self.inputs = tuple(annotations.values())
+        self.slots = (None,) * len(self.inputs)
+        self.deps = ()
+
+        if outputs is None:
+            self.outputs = None
+        elif type(outputs) is tuple:
+            self.outputs = outputs
+        else:
+            self.outputs = (outputs,)
+
+    def produces(self, input):
+        """Index of the output of this step that satisfies input, None when
+        there is none and False when the outputs are not known."""
+        if self.outputs is None:
+            return False
+        for idx in range(len(self.outputs) - 1, -1, -1):
+            output = self.outputs[idx]
+            if not isinstance(output, type):
+                return False
+            if issubclass(output, input):
+                return idx
+        return None
 
 
 class GraphRing():
@@ -20,35 +381,59 @@ class GraphRing():
             else:
                 self.edges = {}
 
-    def __init__(self):
+    def __init__(self, max_entries = 256, max_bytes = None, fingerprinter = None,
+                 workers = 1, executor = None, metrics = None):
         self.cycle = nx.DiGraph()
         self.meta = self.Meta()
         self.meta.nodes['root'] = {'outputs' : []}
         self.cycle.add_node('root')
         self.named_rings = {}
-        
+        self.plans = ChainMap()
+        self.producers = {}
+        self.shared_cycle = False
+        self.signatures = SignatureRegistry()
+        self.fingerprint = fingerprint if fingerprinter is None else fingerprinter
+        self.cache = EdgeCache(max_entries = max_entries, max_bytes = max_bytes)
+        self.workers = workers
+        self.executor = executor
+        self.inflight = {}
+        self.metrics = metrics
+        # guards the cache and the root outputs, edge functions run unlocked
+        self.lock = RLock()
+
+    def __getstate__(self):
+        # executors, locks and in-flight executions can not be pickled
+        state = self.__dict__.copy()
+        state['executor'] = None
+        state['inflight'] = {}
+        state['metrics'] = None
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = RLock()
+
+    def _executor(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers = self.workers)
+        return self.executor
 
     @logger.catch
     def push(self, name, fns):
         def last_index(idx, arr):
             return idx == (len(arr) - 1)
 
+        if self.shared_cycle:
+            self.cycle = self.cycle.copy()
+            self.shared_cycle = False
+
         node_c = 'root'
+        plan = []
 
         for i in range(0,len(fns)):
 
             fn = fns[i]
-            inputs = fn.__annotations__.copy()
-            outputs = None
-
-            #assert(len(inputs) > 0) # This module will not work without annotations
-
-            if 'return' in inputs:
-                outputs = inputs['return']
-
-            if 'return' in inputs:
-                del inputs['return']
-
             node_id = None
 
             if last_index(i,fns):
@@ -56,179 +441,543 @@ class GraphRing():
             else:
                 node_id = str(uuid.uuid1())
                 self.cycle.add_node(node_id)
-                self.meta.nodes[node_id] = {'outputs' : []}
+                self.meta.nodes[node_id] = {}
 
             e = (node_c, node_id)
-            self.meta.edges[e] = {'fn' : fn, 'fn_signature' : None}
+            self.meta.edges[e] = {'fn' : fn}
             self.cycle.add_edges_from([e])
+            plan.append(Step(e, fn, self.signatures.register(fn)))
 
             if node_c == 'root':
                 self.named_rings[name] = ('root', node_id)
 
             node_c = node_id
 
-    def _find_in_providers(self, inputs, providers):
-        fn_providers = []
-        fn_providers_not_found = []
-
-        for _, input in inputs.items():
-            provider = self._provider_by_class(input, providers)
-            if provider is not None:
-                fn_providers.append(provider)
-            else:
-                fn_providers_not_found.append(input)
-        return fn_providers, fn_providers_not_found
-    
-    def _provider_by_class(self, superClassType, providers):
-        for p in providers:
-            if issubclass(type(p), superClassType):
-                return p
+        self.plans[name] = self._compile(plan)
+        self.producers = {}
+
+    def fork(self):
+        """Returns a revision of this ring that shares its cache and signatures.
+
+        Plans, named rings and node/edge metadata are layered on top of this
+        ring's with ChainMaps, so a revision only stores the rings pushed on
+        it and cached outputs are shared by reference, along with the lock
+        guarding them, the executor and the metrics. The cycle graph is
+        copied the first time the revision is pushed to.
+        """
+        def layer(mapping, depth = 32):
+            if not isinstance(mapping, ChainMap):
+                mapping = ChainMap(mapping)
+            if len(mapping.maps) > depth:
+                mapping = ChainMap(dict(mapping))
+            return mapping.new_child()
+
+        # not copy.copy, __getstate__ would drop the executor and the metrics;
+        # the lock is shared with the cache it guards
+        ring = type(self).__new__(type(self))
+        ring.__dict__ = self.__dict__.copy()
+        ring.meta = self.Meta(nodes = layer(self.meta.nodes), edges = layer(self.meta.edges))
+        ring.meta.nodes['root'] = {'outputs' : list(self.meta.nodes['root']['outputs'])}
+        ring.named_rings = layer(self.named_rings)
+        ring.plans = layer(self.plans)
+        ring.producers = {}
+        ring.inflight = {}
+        ring.shared_cycle = True
+        self.shared_cycle = True
+        return ring
+
+    def _compile(self, plan):
+        for k, step in enumerate(plan):
+            step.slots = tuple(self._slot(plan, k, input) for input in step.inputs)
+            step.deps = self._dependencies(plan, k)
+        return plan
+
+    def _dependencies(self, plan, k):
+        step = plan[k]
+        unknown = any(plan[j].produces(object) is False for j in range(k))
+        for input, slot in zip(step.inputs, step.slots):
+            if slot is None and (unknown or not isinstance(input, type)):
+                # the input may come from any earlier step, keep the ring order
+                return tuple(range(k))
+        return tuple(sorted(set(slot[0] for slot in step.slots if slot is not None)))
+
+    def _slot(self, plan, k, input):
+        if not isinstance(input, type):
+            return None
+        # the most recent output of a matching type wins, as in ProviderRegistry
+        for j in range(k - 1, -1, -1):
+            idx = plan[j].produces(input)
+            if idx is False:
+                return None
+            if idx is not None:
+                return (j, idx)
         return None
 
-    def _signature(self, fn):
-        fn_inputs_signature = fn.__annotations__.copy()
-        fn_outputs_signature = None
-        
-        if 'return' in fn_inputs_signature:
-            fn_outputs_signature = fn.__annotations__['return']
-            del fn_inputs_signature['return']
-        
-        return fn_inputs_signature, fn_outputs_signature
-
-    def _filter_by_signature(self, outputs,fn_output_signature):
-        signatures = fn_output_signature
-        filtered = []
-        
-        if type(fn_output_signature) is not tuple:
-            signatures = (signatures,)
-        if type(outputs) is not list:
-            outputs = [outputs]
-
-        for signature in signatures:
-            output = self._provider_by_class(signature, outputs)
-            if output is not None:
-                filtered.append(output)
-        
-        return filtered
-
-    def _execute_or_load_from_cache(self, fn, fn_args, edge):
-
-        def wfn():
+    def _producers(self, name, missing):
+        """Steps of other rings that produce the missing input types.
+
+        For every type, the prefix of another ring is run up to the step that
+        declares an output of that type. Prefixes that need nothing from
+        outside the ring are preferred, then rings in push order.
+        """
+        memo = (name, missing)
+        if memo in self.producers:
+            return self.producers[memo]
+
+        producers = []
+        for input in missing:
+            candidates = []
+            for other, plan in self.plans.items():
+                if other == name:
+                    continue
+                found = None
+                for j, step in enumerate(plan):
+                    idx = step.produces(input)
+                    if idx is not None and idx is not False:
+                        found = j
+                if found is not None:
+                    prefix = plan[:found + 1]
+                    contained = all(slot is not None for step in prefix for slot in step.slots)
+                    candidates.append((not contained, len(candidates), prefix))
+
+            if len(candidates) > 0:
+                for step in min(candidates, key = lambda c: c[:2])[2]:
+                    if step not in producers:
+                        producers.append(step)
+
+        self.producers[memo] = producers
+        return producers
+
+    def _resolve(self, step, results, providers):
+        fn_args = []
+        fn_fingerprints = []
+        missing = []
+
+        for input, slot in zip(step.inputs, step.slots):
+            p = None
+            if slot is not None and results is not None:
+                produced = results[slot[0]][3]
+                if slot[1] < len(produced) and isinstance(produced[slot[1]][0], input):
+                    p = produced[slot[1]]
+            if p is None:
+                p = providers.find(input)
+            if p is None:
+                missing.append(input)
+            else:
+                fn_args.append(p[0])
+                fn_fingerprints.append(p[1])
+
+        return fn_args, fn_fingerprints, missing
+
+    def _lookup(self, key):
+        if not cacheable(key):
+            return None
+        with self.lock:
+            return self.cache.get(key)
+
+    def _store(self, key, outputs):
+        if type(outputs) is not tuple:
+            outputs = (outputs,)
+        if cacheable(key):
+            with self.lock:
+                self.cache.put(key, outputs)
+        return outputs
+
+    def _call(self, fn, fn_args):
+        if self.metrics is None:
             return fn(*fn_args)
+        return self.metrics.call(fn, fn_args)
+
+    def _submit(self, executor, fn, fn_args):
+        # only the edge function and its arguments are sent to the executor,
+        # a process pool would otherwise pickle the whole ring for every step
+        if self.metrics is None:
+            return executor.submit(fn, *fn_args)
+        if isinstance(executor, ProcessPoolExecutor):
+            # the registry stays in this process, only the wall time including
+            # the transfer to the worker process is recorded
+            start = time.perf_counter()
+            future = executor.submit(fn, *fn_args)
+            future.add_done_callback(lambda f: self.metrics.observe_time(fn, time.perf_counter() - start))
+            return future
+        return executor.submit(self.metrics.call, fn, fn_args)
+
+    def _result(self, step, key, outputs, cached):
+        if cacheable(key):
+            with self.lock:
+                self.cache.pin(step.edge, key)
+        if self.metrics is not None:
+            nbytes = None
+            if not cached:
+                nbytes = self.cache.sizes.get(key)
+                if nbytes is None:
+                    nbytes = self.cache._sizeof(outputs)
+            self.metrics.observe_result(step.fn, cached, nbytes)
+        published = [(p, output_fingerprint(key, i)) for i, p in enumerate(outputs)]
+        return outputs, key, cached, published
+
+    def _execute_or_load_from_cache(self, step, fn_args, fn_fingerprints, providers):
+        key = (step.signature, tuple(fn_fingerprints))
+
+        outputs = self._lookup(key)
+        cached = outputs is not None
+        if not cached:
+            outputs = self._store(key, self._call(step.fn, fn_args))
+
+        result = self._result(step, key, outputs, cached)
+        for p in result[3]:
+            providers.push(*p)
+
+        return result
+
+    def _provide(self, providers, produced, missing):
+        # producers only fill in what was missing, their other outputs must
+        # not shadow the values the ring already had
+        for input in missing:
+            p = produced.find(input)
+            if p is not None:
+                providers.push(*p)
+
+    def _resolve_or_produce(self, name, step, results, providers):
+        fn_args, fn_fingerprints, missing = self._resolve(step, results, providers)
+
+        if len(missing) > 0:
+            produced = providers.copy()
+            for producer in self._producers(name, tuple(missing)):
+                producer_args, producer_fingerprints, _ = self._resolve(producer, None, produced)
+                self._execute_or_load_from_cache(producer, producer_args, producer_fingerprints, produced)
+            self._provide(providers, produced, missing)
+            fn_args, fn_fingerprints, _ = self._resolve(step, results, providers)
+
+        return fn_args, fn_fingerprints
+
+    def _run_sequential(self, name, plan, providers):
+        results = []
+        for step in plan:
+            fn_args, fn_fingerprints = self._resolve_or_produce(name, step, results, providers)
+            results.append(self._execute_or_load_from_cache(step, fn_args, fn_fingerprints, providers))
+        return results
+
+    def _run_parallel(self, name, plan, providers):
+        """Runs every step as soon as the steps it depends on completed.
+
+        Cache lookups, argument resolution and bookkeeping stay on the calling
+        thread, only the edge functions run on the executor. Outputs are
+        committed to the registry in ring order, so resolution does not depend
+        on which of two independent steps finished first.
+        """
+        executor = self._executor()
+        results = [None] * len(plan)
+        waiting = list(range(len(plan)))
+        running = {}
+        committed = 0
 
-        _, fn_outputs_signature = self._signature(fn)
-
-        m = hl.sha256()
-        m.update(inspect.getsource(fn).encode('utf-8'))
-        signature = m.hexdigest()
-
-        prior_signature = self.meta.edges[edge]['fn_signature']
-        if prior_signature is not None and prior_signature == signature:
-            # load from cache
-            _, to_node = edge
-
-            outputs = self._filter_by_signature(
-                self.meta.nodes[to_node]['outputs'],
-                fn_outputs_signature)
-
-            if outputs is not None:
-                return outputs, True
+        while True:
+            while committed < len(plan) and results[committed] is not None:
+                for p in results[committed][3]:
+                    providers.push(*p)
+                committed += 1
+
+            if committed == len(plan):
+                return results
+
+            progressed = False
+            for k in list(waiting):
+                step = plan[k]
+                if any(results[d] is None for d in step.deps):
+                    continue
+                if len(step.deps) == k and committed < k:
+                    # ordered steps may read any earlier output from the registry
+                    continue
+
+                waiting.remove(k)
+                fn_args, fn_fingerprints = self._resolve_or_produce(name, step, results, providers)
+                key = (step.signature, tuple(fn_fingerprints))
+                outputs = self._lookup(key)
+                if outputs is not None:
+                    results[k] = self._result(step, key, outputs, True)
+                    progressed = True
+                else:
+                    running[self._submit(executor, step.fn, fn_args)] = (k, key)
+
+            if progressed:
+                continue
+
+            assert(len(running) > 0)
+            done, _ = wait(running, return_when = FIRST_COMPLETED)
+            for future in done:
+                k, key = running.pop(future)
+                results[k] = self._result(plan[k], key, self._store(key, future.result()), False)
+
+    def _publish(self, published):
+        with self.lock:
+            self._publish_locked(published)
+
+    def _publish_locked(self, published):
+        # outputs of the last edge of a ring are made available to every ring
+        outputs = self.meta.nodes['root']['outputs']
+        replaced = []
+        for p in published:
+            idx = None
+            for i, o in enumerate(outputs):
+                if type_of(p[0]) == type_of(o[0]):
+                    idx = i
+                    break
+
+            if idx is None:
+                outputs.append(p)
+            else:
+                if outputs[idx][1] is not None and outputs[idx][1] != p[1]:
+                    replaced.append(outputs[idx][1])
+                outputs[idx] = p
+
+        if len(replaced) > 0:
+            # whatever other rings derived from the replaced values is stale
+            dropped = self.cache.invalidate(fingerprints = replaced)
+            self._retract(dropped - set(p[1] for p in published))
+
+    def _providers(self, args, fingerprints = None):
+        if fingerprints is None:
+            fingerprints = [self.fingerprint(arg) for arg in args]
+        providers = ProviderRegistry()
+        for arg, fp in zip(args, fingerprints):
+            providers.append(arg, fp)
         
-        self.meta.edges[edge]['fn_signature'] = signature
-        return wfn(), False
-
-    def _execute_edge(self, edge : tuple, providers = []):
+        # add all providers from root node
+        with self.lock:
+            for p in self.meta.nodes['root']['outputs']:
+                if type_of(p[0]) not in providers:
+                    providers.append(*p)
 
-        from_node, _ = edge
-        fn = self.meta.edges[edge]['fn']
-        
-        fn_inputs_signature, _ = self._signature(fn)
-        fn_args, fn_args_not_found = self._find_in_providers(fn_inputs_signature, providers)
-        
-        if len(fn_args_not_found) > 0:
-            prior_node = next(self.cycle.predecessors(from_node))
-            prior_edge = (prior_node, from_node)
-            for p in self._execute_edge(prior_edge, providers = providers):
-                providers.insert(0, p)
-            fn_args, _ = self._find_in_providers(fn_inputs_signature, providers)
-
-        rtn, cached = self._execute_or_load_from_cache(fn, fn_args, edge)
-        if type(rtn) is not tuple:
-            rtn = (rtn,)
-
-        for p in rtn:
-            providers.insert(0, p)
-        
-        return fn, rtn, cached, providers
+        return providers
 
     @logger.catch
     def run(self, name : str, *args):
-        from_node, to_node = self.named_rings[name]
-        e = (from_node, to_node)
-        providers = []
-        if len(args) > 0:
-            providers = [*args]
-        
-        # add all providers from root node
-        for p in self.meta.nodes['root']['outputs']:
-            if type(p) not in list(map(lambda x: type(x), providers)):
-                providers.append(p)
+        start = time.perf_counter()
+        plan = self.plans[name]
+        providers = self._providers(args)
 
+        if self.workers > 1 or self.executor is not None:
+            results = self._run_parallel(name, plan, providers)
+        else:
+            results = self._run_sequential(name, plan, providers)
 
-        # invalidate ring outputs if the inputs are not the same
-        if 'inputs' in self.meta.edges[e]:
-            valid = True
-            for item1, item2 in list(zip(self.meta.edges[e]['inputs'], args)):
-                if type(item1) == type(item2) == np.ndarray:
-                    valid = valid and (np.array_equal(item1,item2))
-                else:
-                    valid = valid and (item1 == item2)
-            if not valid: self.expunge()
-        self.meta.edges[e]['inputs'] = args
+        rtn, _, _, published = results[-1]
+        self._publish(published)
+        if self.metrics is not None:
+            self.metrics.observe_run(name, time.perf_counter() - start)
 
-        rtn = None
+        if len(rtn) == 1:
+            rtn = rtn[0]
+
+        return rtn, zip([step.fn for step in plan], [r[0] for r in results])
+
+    def _item_fingerprints(self, plan, batch):
+        """Fingerprints of the values a run of plan on batch reads besides
+        batch itself, None when some of them would have to be produced."""
+        # the batch itself is not fingerprinted, it is never part of the result
+        providers = self._providers((batch,), (None,))
+        fingerprints = []
+        for step in plan:
+            for input, slot in zip(step.inputs, step.slots):
+                if slot is not None:
+                    continue
+                p = providers.find(input)
+                if p is None:
+                    return None
+                if p[0] is not batch:
+                    fingerprints.append(p[1])
+        return tuple(fingerprints)
+
+    def map(self, name : str, items):
+        """Runs the named ring once on the stacked items whose result is not
+        cached yet and returns the list of the results of every item.
+
+        The ring must return one result per item. Results are also cached
+        item by item, keyed by the ring, the item fingerprint and the
+        fingerprints of the other values the ring reads, so later calls hit
+        for every item seen before whatever batch it came with, and replacing
+        the model drops them. Rings needing values from producers are run on
+        the whole batch. Returns ``(results, fns_rtns)``, where ``fns_rtns``
+        is None when every item was cached.
+        """
+        plan = self.plans[name]
+        items = list(items)
+        external = self._item_fingerprints(plan, np.asarray(items))
+        if external is None:
+            rtn, fns_rtns = self._run_batch(name, np.asarray(items))
+            return list(rtn), fns_rtns
 
-        fns = []
-        rtns = []
+        m = hl.sha256()
+        for step in plan:
+            m.update(step.signature.encode('utf-8'))
+        signature = 'map-' + m.hexdigest()
+        fps = [self.fingerprint(item) for item in items]
+
+        results = [None] * len(items)
+        misses = []
+        for i, fp in enumerate(fps):
+            outputs = self._lookup((signature, (fp,) + external))
+            if outputs is None:
+                misses.append(i)
+            else:
+                results[i] = outputs[0]
+
+        fns_rtns = None
+        if len(misses) > 0:
+            batch = np.asarray([items[i] for i in misses])
+            rtn, fns_rtns = self._run_batch(name, batch)
+            # the run may have replaced what the ring reads
+            external = self._item_fingerprints(plan, batch)
+            for i, result in zip(misses, rtn):
+                results[i] = result
+                if external is not None:
+                    self._store((signature, (fps[i],) + external), (result,))
+        return results, fns_rtns
+
+    def _run_batch(self, name, batch):
+        # run logs and swallows errors, a batch without results must fail
+        results = self.run(name, batch)
+        if results is None:
+            raise RuntimeError('Ring {name} failed on a batch of shape {shape}'.format(name = name, shape = batch.shape))
+        return results
+
+    async def _acall(self, fn, fn_args):
+        if asyncio.iscoroutinefunction(fn):
+            start = time.perf_counter()
+            try:
+                return await fn(*fn_args)
+            finally:
+                if self.metrics is not None:
+                    # other tasks run while awaiting, so the CPU time is not the call's own
+                    self.metrics.observe_time(fn, time.perf_counter() - start)
+        if self.executor is not None:
+            return await asyncio.wrap_future(self._submit(self.executor, fn, fn_args))
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, partial(self._call, fn, fn_args))
+
+    async def _acompute(self, key, step, fn_args):
+        try:
+            return self._store(key, await self._acall(step.fn, fn_args))
+        finally:
+            self.inflight.pop(key, None)
+
+    async def _aexecute_or_load_from_cache(self, step, fn_args, fn_fingerprints):
+        key = (step.signature, tuple(fn_fingerprints))
+
+        outputs = self._lookup(key)
+        if outputs is not None:
+            return self._result(step, key, outputs, True)
+
+        # identical concurrent executions share one computation
+        task = self.inflight.get(key) if cacheable(key) else None
+        cached = task is not None
+        if not cached:
+            task = asyncio.ensure_future(self._acompute(key, step, fn_args))
+            if cacheable(key):
+                self.inflight[key] = task
+
+        outputs = await asyncio.shield(task)
+        return self._result(step, key, outputs, cached)
+
+    async def _aresolve_or_produce(self, name, step, results, providers):
+        fn_args, fn_fingerprints, missing = self._resolve(step, results, providers)
+
+        if len(missing) > 0:
+            produced = providers.copy()
+            for producer in self._producers(name, tuple(missing)):
+                producer_args, producer_fingerprints, _ = self._resolve(producer, None, produced)
+                result = await self._aexecute_or_load_from_cache(producer, producer_args, producer_fingerprints)
+                for p in result[3]:
+                    produced.push(*p)
+            self._provide(providers, produced, missing)
+            fn_args, fn_fingerprints, _ = self._resolve(step, results, providers)
+
+        return fn_args, fn_fingerprints
+
+    async def arun(self, name : str, *args):
+        """Asynchronous run(): ``async def`` edge functions are awaited, the
+        others run on the executor (the loop's default one unless set).
+
+        Independent steps run concurrently, with the same ordering guarantees
+        as the parallel scheduler of run(), and concurrent calls that reach the
+        same cache key wait for a single execution.
+        """
+        start = time.perf_counter()
+        plan = self.plans[name]
+        providers = self._providers(args)
+        results = [None] * len(plan)
+        waiting = list(range(len(plan)))
+        running = {}
+        committed = 0
 
         while True:
-            
-            # execute and advance
-            fn, rtn, cached, providers = self._execute_edge(e, providers = providers)
-            
-            fns.append(fn)
-            rtns.append(rtn)
+            while committed < len(plan) and results[committed] is not None:
+                for p in results[committed][3]:
+                    providers.push(*p)
+                committed += 1
 
-            if not cached:
+            if committed == len(plan):
+                break
 
-                for r in rtn:
-                    idx = None
-                    for i, o in enumerate(self.meta.nodes[to_node]['outputs']):
-                        if type(r) == type(o):
-                            idx = i                            
-                            break
+            for k in list(waiting):
+                step = plan[k]
+                if any(results[d] is None for d in step.deps):
+                    continue
+                if len(step.deps) == k and committed < k:
+                    continue
 
-                    if idx is None:
-                        self.meta.nodes[to_node]['outputs'].append(r)
-                    else:
-                        self.meta.nodes[to_node]['outputs'][idx] = r
+                waiting.remove(k)
+                fn_args, fn_fingerprints = await self._aresolve_or_produce(name, step, results, providers)
+                running[asyncio.ensure_future(
+                    self._aexecute_or_load_from_cache(step, fn_args, fn_fingerprints))] = k
 
-            # terminate
-            if to_node == 'root':
-                break
+            done, _ = await asyncio.wait(running, return_when = asyncio.FIRST_COMPLETED)
+            for task in done:
+                results[running.pop(task)] = task.result()
 
-            # advance
-            from_node = to_node
-            to_node = next(self.cycle.successors(to_node)) # Since these are rings there should only be one successor
-            e = (from_node, to_node)
+        rtn, _, _, published = results[-1]
+        self._publish(published)
+        if self.metrics is not None:
+            self.metrics.observe_run(name, time.perf_counter() - start)
 
         if len(rtn) == 1:
             rtn = rtn[0]
 
-        return rtn, zip(fns, rtns)
-
-    def expunge(self):
-        for node_id, _  in self.meta.nodes.items():
-            self.meta.nodes[node_id]['outputs'] = []
-        for e, _ in self.meta.edges.items():
-            self.meta.edges[e]['fn_signature'] = None
\ No newline at end of file
+        return rtn, zip([step.fn for step in plan], [r[0] for r in results])
+
+    def _invalidate_fns(self, fns):
+        signatures = set(self.signatures[fn] for fn in fns)
+        stale = [key for key in self.cache.entries if key[0] in signatures]
+        return self.cache.invalidate(keys = stale)
+
+    def expunge(self, name = None):
+        """Drop cached outputs of the named ring and of everything downstream
+        of them, or of every ring when no name is given."""
+        with self.lock:
+            if name is None:
+                self.meta.nodes['root']['outputs'] = []
+                self.cache.clear()
+                return
+
+            fns = [step.fn for step in self.plans[name]]
+            self._retract(self._invalidate_fns(fns))
+
+    def _retract(self, dropped):
+        outputs = self.meta.nodes['root']['outputs']
+        self.meta.nodes['root']['outputs'] = [p for p in outputs if p[1] not in dropped]
+
+    def invalidate_signature(self, fn = None):
+        """Forget the memoized fingerprint of fn (or of every function) and
+        drop the cached outputs computed with the old fingerprint."""
+        if fn is None:
+            fns = [edge['fn'] for edge in self.meta.edges.values()]
+        else:
+            fns = [fn]
+        with self.lock:
+            self._retract(self._invalidate_fns(fns))
+            self.signatures.invalidate(fn)
+
+        for plan in self.plans.values():
+            for step in plan:
+                step.signature = self.signatures[step.fn]
@@ -0,0 +1,171 @@
+import time
+import tracemalloc
+from bisect import bisect_left
+from threading import Lock
+
+# seconds, from 100us to 1 minute
+TIME_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+# bytes, from 1KiB to 1GiB
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(11))
+
+
+class Counter():
+    __slots__ = ('value', 'lock')
+
+    def __init__(self):
+        self.value = 0
+        self.lock = Lock()
+
+    def inc(self, amount = 1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class Histogram():
+    """Cumulative histogram over fixed upper bounds, as in Prometheus."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count', 'lock')
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+        self.lock = Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self, name, labels):
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float('inf'),), counts):
+            cumulative += n
+            yield name + '_bucket', labels + (('le', _format(bound)),), cumulative
+        yield name + '_sum', labels, total
+        yield name + '_count', labels, count
+
+
+def _format(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class MetricsRegistry():
+    """In-process registry of counters and histograms.
+
+    A GraphRing given a registry records, for every edge it runs, the wall
+    and CPU time of the call, cache hits and misses, the size of the outputs
+    and, with ``trace_memory``, the peak memory allocated during the call.
+    Samples are labelled with the qualified name of the edge function and
+    ``render`` dumps them in the Prometheus text exposition format.
+
+    ``trace_memory`` starts tracemalloc, which slows every allocation of the
+    process down. Its peak is process wide, so edges running concurrently
+    are charged for each other's allocations. Before Python 3.9 tracemalloc
+    can not reset its peak alone, so the traces are cleared before every
+    call and snapshots taken by other code lose the earlier allocations.
+    """
+
+    def __init__(self, trace_memory = False, time_buckets = TIME_BUCKETS, size_buckets = SIZE_BUCKETS):
+        self.trace_memory = trace_memory
+        self.time_buckets = time_buckets
+        self.size_buckets = size_buckets
+        self.metrics = {}
+        self.lock = Lock()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _get(self, kind, name, help, labels, factory):
+        labels = tuple(sorted(labels.items()))
+        with self.lock:
+            family = self.metrics.get(name)
+            if family is None:
+                family = self.metrics[name] = (kind, help, {})
+            elif family[0] != kind:
+                raise ValueError('Metric {name} is a {kind}'.format(name = name, kind = family[0]))
+            series = family[2].get(labels)
+            if series is None:
+                series = family[2][labels] = factory()
+            return series
+
+    def counter(self, name, help = '', **labels) -> Counter:
+        return self._get('counter', name, help, labels, Counter)
+
+    def histogram(self, name, help = '', buckets = None, **labels) -> Histogram:
+        buckets = self.time_buckets if buckets is None else buckets
+        return self._get('histogram', name, help, labels, lambda: Histogram(buckets))
+
+    def call(self, fn, args):
+        """Calls fn(*args) and records its wall time, CPU time and, when
+        tracing memory, its peak allocation."""
+        if self.trace_memory:
+            _reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            return fn(*args)
+        finally:
+            cpu = time.thread_time() - cpu
+            wall = time.perf_counter() - wall
+            self.observe_time(fn, wall, cpu)
+            if self.trace_memory:
+                self.histogram('rai_edge_peak_alloc_bytes', 'Peak memory allocated by an edge call',
+                               buckets = self.size_buckets, fn = _name(fn)).observe(
+                    max(0, tracemalloc.get_traced_memory()[1] - before))
+
+    def observe_time(self, fn, wall, cpu = None):
+        self.histogram('rai_edge_wall_seconds', 'Wall time of an edge call', fn = _name(fn)).observe(wall)
+        if cpu is not None:
+            self.histogram('rai_edge_cpu_seconds', 'CPU time of an edge call', fn = _name(fn)).observe(cpu)
+
+    def observe_result(self, fn, cached, nbytes = None):
+        self.counter('rai_edge_cache_total', 'Edge cache lookups',
+                     fn = _name(fn), result = 'hit' if cached else 'miss').inc()
+        if nbytes is not None:
+            self.histogram('rai_edge_output_bytes', 'Size of the outputs of an edge call',
+                           buckets = self.size_buckets, fn = _name(fn)).observe(nbytes)
+
+    def observe_run(self, ring, wall):
+        self.histogram('rai_ring_seconds', 'Wall time of a ring run', ring = ring).observe(wall)
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            families = [(name, kind, help, list(series.items()))
+                        for name, (kind, help, series) in sorted(self.metrics.items())]
+        for name, kind, help, series in families:
+            if help:
+                lines.append('# HELP {name} {help}'.format(name = name, help = help))
+            lines.append('# TYPE {name} {kind}'.format(name = name, kind = kind))
+            for labels, metric in series:
+                for sample, sample_labels, value in metric.samples(name, labels):
+                    if sample_labels:
+                        sample += '{' + ','.join('{k}="{v}"'.format(k = k, v = _escape(v))
+                                                 for k, v in sample_labels) + '}'
+                    lines.append('{sample} {value}'.format(sample = sample, value = _format(value)))
+        return '\n'.join(lines) + '\n'
+
+
+def _reset_peak():
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    else:
+        # Python < 3.9, clearing the traces also resets the peak
+        tracemalloc.clear_traces()
+
+
+def _name(fn):
+    return getattr(fn, '__qualname__', repr(fn))
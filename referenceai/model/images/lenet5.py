@@ -1,8 +1,24 @@
 from keras import Model, Sequential, layers
 from keras.optimizers import Optimizer
-from referenceai.datasource import ImagesDataSource
+from keras.utils import Sequence
+from referenceai.datasource import ImagesDataSource, BatchIterator, PrefetchLoader
 import numpy as np
 
+class BatchSequence(Sequence):
+    """keras.utils.Sequence over a BatchIterator, reshuffled every epoch."""
+
+    def __init__(self, batches: BatchIterator):
+        self.batches = batches
+
+    def __len__(self):
+        return len(self.batches)
+
+    def __getitem__(self, idx):
+        return self.batches[idx]
+
+    def on_epoch_end(self):
+        self.batches.reshuffle()
+
 class LeNet5():
     @classmethod
     def model(cls, input_shape : (int,int)):
@@ -23,9 +39,33 @@ class LeNet5():
         return model
 
     @classmethod
-    def train(cls, model: Model, datasource: ImagesDataSource, hyperparameters: dict) -> Model:
+    def train(cls, model: Model, datasource: ImagesDataSource, hyperparameters: dict, preprocess = None) -> Model:
         model.compile(optimizer = hyperparameters['optimizer'], 
                       loss = hyperparameters['loss'])
+
+        if hyperparameters.get("streaming", False):
+            # train from batches so the dataset never has to fit in memory
+            train = datasource.batches('train', batch_size = hyperparameters["batch_size"])
+            test = datasource.batches('test', batch_size = hyperparameters["batch_size"], shuffle = False)
+
+            if preprocess is None:
+                model.fit_generator(BatchSequence(train),
+                                    validation_data = BatchSequence(test),
+                                    epochs = hyperparameters["epochs"])
+                return model
+
+            # preprocess the next batches on worker threads while the current one trains
+            depth = hyperparameters.get("prefetch", 4)
+            workers = hyperparameters.get("workers", 2)
+            train = PrefetchLoader(train, preprocess, depth = depth, workers = workers)
+            test = PrefetchLoader(test, preprocess, depth = depth, workers = workers)
+            model.fit_generator(train.repeat(),
+                                steps_per_epoch = len(train),
+                                validation_data = test.repeat(),
+                                validation_steps = len(test),
+                                epochs = hyperparameters["epochs"])
+            return model
+
         model.fit(datasource.train_set()[0], 
                   datasource.train_set()[1],
                   validation_data=(datasource.test_set()[0], 
@@ -34,6 +74,14 @@ class LeNet5():
                   batch_size = hyperparameters["batch_size"])
         return model
 
+    @classmethod
+    def finetune(cls, model: Model, batches, preprocess) -> Model:
+        """One gradient step per (x, y) batch, on an already trained model."""
+        for x, y in batches:
+            x, y = preprocess(x, y)
+            model.train_on_batch(x, y)
+        return model
+
     @classmethod
     def classify(cls, model: Model, image: np.ndarray) -> np.ndarray:
         return model.predict(image)
\ No newline at end of file
@@ -1,16 +1,13 @@
-import pickle
 import os
 from os import path, makedirs
 import shutil
 from loguru import logger
 from abc import abstractmethod
-from typing import Callable
+from typing import Callable, TYPE_CHECKING
 import numpy as np
 import hashlib as hl
-import keras
 
 import inspect
-from shutil import rmtree
 from referenceai.utils.provider import DictionaryRing
 
 import networkx as nx
@@ -21,6 +18,13 @@ import copy
 from .datasource import DataSource
 from .graph import GraphRing
 from .transform import Transform
+from .store import SegmentStore
+from .runlog import RunLog
+from .batching import MicroBatcher
+
+if TYPE_CHECKING:
+    # only for annotations, importing keras takes seconds and pulls in TensorFlow
+    import keras
 
 
 class PipelineAIProvider():
@@ -29,7 +33,7 @@ class PipelineAIProvider():
         pass
 
     @abstractmethod
-    def optimizer(self) -> keras.optimizers.Optimizer:
+    def optimizer(self) -> 'keras.optimizers.Optimizer':
         pass
 
     @abstractmethod
@@ -45,19 +49,26 @@ class PipelineAIProvider():
         pass
 
     @abstractmethod
-    def model(self) -> keras.Model:
+    def model(self) -> 'keras.Model':
         pass
 
     @abstractmethod
-    def train(self, ds: DataSource, model: keras.Model) -> keras.Model:
+    def train(self, ds: DataSource, model: 'keras.Model') -> 'keras.Model':
         pass
 
+    # Optional. Providers may define
+    #   finetune(self, ds: DataSource, model, hyperparameters: dict, t: Transform) -> (model, Transform)
+    # training model on the pending samples of ds.updates, see
+    # DataSource.finetune_batches, and committing them. Without it updates
+    # retrain on the whole transformed dataset.
+    finetune = None
+
     @abstractmethod
-    def save(self, model: keras.Model):
+    def save(self, model: 'keras.Model'):
         pass
 
     @abstractmethod
-    def load(self) -> keras.Model:
+    def load(self) -> 'keras.Model':
         pass
 
     @abstractmethod
@@ -72,30 +83,40 @@ class PipelineAIProvider():
     def inverse_transform_one(self, labels : np.ndarray) -> str:
         pass
 
+    @abstractmethod
+    def transform_batch(self, items: np.ndarray) -> np.ndarray:
+        pass
+
+    @abstractmethod
+    def inverse_transform_batch(self, labels : np.ndarray) -> list:
+        pass
+
 
 class Pipeline():
 
     base_cache_path = os.path.join(".rai","cache")
 
-    def __init__(self, id = None):
+    def __init__(self, id = None, workers = 1, history = 128, history_path = None, metrics = None):
         if id is None:
             self.id = str(uuid.uuid1())
         else:
             self.id = id
         
-        self.rings = [GraphRing()]
-        self.runs = [] # Array of dictionaries of the form {'ring' : <class GraphRing>,}
+        self.metrics = metrics
+        self.rings = [GraphRing(workers = workers, metrics = metrics)]
+        self.runs = RunLog(capacity = history, spill_path = history_path)
         
         if not path.exists(self.base_cache_path):
             makedirs(self.base_cache_path)
         
         self.base_path = os.path.join(self.base_cache_path, self.id)
+        self.store = SegmentStore(self.base_path)
 
     def revise(self):
-        self.rings.insert(0, self.rings[0])
+        self.rings.insert(0, self.rings[0].fork())
     
-    def expunge(self):
-        self.rings[0].expunge()
+    def expunge(self, name = None):
+        self.rings[0].expunge(name)
 
     def push(self, name, fns, revise = True):
         self.rings[0].push(name, fns)
@@ -103,33 +124,40 @@ class Pipeline():
 
     def run(self, name, *args):
         rtn, fns_rtns = self.rings[0].run(name, *args)
-        self.runs.insert(0, {'ring' : self.rings[0], 'stack' : fns_rtns})
+        self.runs.record(name, fns_rtns)
+        return rtn
+
+    def map(self, name, items):
+        rtn, fns_rtns = self.rings[0].map(name, items)
+        if fns_rtns is not None:
+            self.runs.record(name, fns_rtns)
+        return rtn
+
+    async def arun(self, name, *args):
+        rtn, fns_rtns = await self.rings[0].arun(name, *args)
+        self.runs.record(name, fns_rtns)
         return rtn
 
     def restore_graph(self, ring_idx):
-        self.rings.insert(0, self.rings[ring_idx])
+        self.rings.insert(0, self.rings[ring_idx].fork())
 
     def serialize(self):
-        with open(self.base_path, "wb") as f:
-            pickle.dump({'rings' : self.rings, 'runs' : self.runs}, f)
+        self.store.save(self.rings[0], list(self.runs))
     
     def deserialize(self):
         try:
-            if path.exists(self.base_path):
-                with open(self.base_path, "rb") as f:
-                    info = pickle.load(f)
-                    self.rings = info['rings']
-                    self.runs = info['runs']
+            if self.store.exists():
+                self.runs.restore(self.store.load(self.rings[0]))
             else:
                 logger.warning("Unable to deserialize graph ring at {path}. File does not exist.".format(path = self.base_path))
         except:
             # we are now going to remove the cache
-            if path.exists(self.base_path):
-                rmtree(self.base_path)
+            self.store.clear()
+
 class PipelineAI(Pipeline):
 
-    def __init__(self, id, provider: PipelineAIProvider):
-        super().__init__(id = id)
+    def __init__(self, id, provider: PipelineAIProvider, workers = 1, history = 128, history_path = None, metrics = None):
+        super().__init__(id = id, workers = workers, history = history, history_path = history_path, metrics = metrics)
         self.provider = provider
         self.push("train",
                       [self.provider.hyperparameters,
@@ -143,17 +171,21 @@ class PipelineAI(Pipeline):
                        self.provider.classify,
                        self.provider.inverse_transform_one], revise = False)
 
-        self.push("update",
-                      [self.provider.updatesource,
-                       self.provider.transform,
-                       self.provider.train,
-                       ], revise = False)
+        self.push("classify_batch",
+                      [self.provider.transform_batch,
+                       self.provider.classify,
+                       self.provider.inverse_transform_batch], revise = False)
 
-        self.push("update_bulk",
-                      [self.provider.updatesource_bulk,
-                       self.provider.transform,
-                       self.provider.train,
-                       ], revise = False)
+        if self.provider.finetune is not None:
+            # only the new samples are transformed and trained on
+            update = [self.provider.finetune]
+        else:
+            update = [self.provider.transform, self.provider.train]
+
+        # the data source is read first so the update rings never borrow the
+        # transformed copy the train ring produces
+        self.push("update", [self.provider.datasource, self.provider.updatesource] + update, revise = False)
+        self.push("update_bulk", [self.provider.datasource, self.provider.updatesource_bulk] + update, revise = False)
         
         self.deserialize()
 
@@ -163,8 +195,29 @@ class PipelineAI(Pipeline):
     def classify(self, args):
         return self.run("classify", args)
 
-    def update(self, args):
-        return self.run("update", args)
+    def classify_batch(self, images):
+        return self.run("classify_batch", np.asarray(images))
+
+    def micro_batcher(self, max_batch_size = 32, max_latency = 0.005, workers = 1):
+        """Returns a MicroBatcher that serves concurrent single image
+        classifications with one classify_batch call per batch."""
+        return MicroBatcher(self.classify_batch, max_batch_size = max_batch_size,
+                            max_latency = max_latency, workers = workers)
+
+    def update(self, image, label):
+        return self.run("update", image, label)
+
+    def update_bulk(self, images, labels):
+        return self.run("update_bulk", np.asarray(images), list(labels))
+
+    async def atrain(self):
+        return await self.arun("train")
+
+    async def aclassify(self, args):
+        return await self.arun("classify", args)
+
+    async def aupdate(self, image, label):
+        return await self.arun("update", image, label)
 
-    def update_bulk(self, args):
-        return self.run("update_bulk", args)
+    async def aupdate_bulk(self, images, labels):
+        return await self.arun("update_bulk", np.asarray(images), list(labels))
@@ -0,0 +1,69 @@
+import json
+import time
+from collections import deque
+
+
+class Run():
+    """A single entry of the RunLog: ring name, names of the executed
+    functions and the time the run finished."""
+
+    __slots__ = ('ring', 'stack', 'time')
+
+    def __init__(self, ring, stack, time):
+        self.ring = ring
+        self.stack = stack
+        self.time = time
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __getstate__(self):
+        return (self.ring, self.stack, self.time)
+
+    def __setstate__(self, state):
+        self.ring, self.stack, self.time = state
+
+    def __repr__(self):
+        return "Run(ring={ring!r}, stack={stack!r}, time={time!r})".format(
+            ring = self.ring, stack = self.stack, time = self.time)
+
+
+class RunLog():
+    """Fixed capacity history of pipeline runs, newest first.
+
+    Runs only keep the names of the functions that were executed, never
+    their outputs. When ``spill_path`` is set every run is also appended to
+    that file as a JSON line, which keeps a complete audit trail on disk
+    while memory stays bounded by ``capacity``.
+    """
+
+    def __init__(self, capacity = 128, spill_path = None):
+        self.capacity = capacity
+        self.spill_path = spill_path
+        self.records = deque(maxlen = capacity)
+
+    def record(self, ring, fns_rtns):
+        run = Run(ring, tuple(getattr(fn, '__qualname__', fn) for fn, _ in fns_rtns), time.time())
+        self.records.appendleft(run)
+
+        if self.spill_path is not None:
+            with open(self.spill_path, "a") as f:
+                f.write(json.dumps({'ring' : run.ring, 'stack' : run.stack, 'time' : run.time}) + "\n")
+
+        return run
+
+    def restore(self, runs):
+        """Appends older runs, e.g. of a saved log, while there is room left."""
+        for run in runs:
+            if len(self.records) >= self.capacity:
+                break
+            self.records.append(run)
+
+    def __getitem__(self, idx):
+        return self.records[idx]
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
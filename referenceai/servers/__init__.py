@@ -0,0 +1,2 @@
+from .rest import RESTServer
+from .graphql import GraphQLServer
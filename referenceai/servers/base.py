@@ -0,0 +1,150 @@
+import json
+from threading import Thread, BoundedSemaphore
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from loguru import logger
+
+
+class RequestError(Exception):
+    """Raised by route handlers to answer with a client error."""
+
+    def __init__(self, message, status = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def to_json(obj):
+    def default(o):
+        if hasattr(o, 'tolist'):
+            return o.tolist()
+        return str(o)
+    return json.dumps(obj, default = default).encode('utf-8')
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, handler, app, concurrency, idle_timeout):
+        self.app = app
+        self.slots = BoundedSemaphore(concurrency)
+        self.idle_timeout = idle_timeout
+        # connections waiting to be accepted queue up in the listen backlog
+        self.request_queue_size = max(concurrency, 128)
+        super().__init__(address, handler)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections alive between requests
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        # idle keep-alive connections are closed instead of holding a thread forever
+        self.timeout = self.server.idle_timeout
+        super().setup()
+
+    def _respond(self, status, body):
+        payload = to_json(body)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _dispatch(self, method):
+        route = self.server.app.routes.get((method, self.path.split('?')[0]))
+        if route is None:
+            self._respond(404, {'error' : 'Unknown route {method} {path}'.format(method = method, path = self.path)})
+            return
+
+        try:
+            body = None
+            length = int(self.headers.get('Content-Length', 0))
+            if length > 0:
+                try:
+                    body = json.loads(self.rfile.read(length))
+                except ValueError:
+                    raise RequestError('Request body is not valid JSON')
+            # at most `concurrency` requests are handled at once, idle
+            # connections between two requests do not hold a slot
+            with self.server.slots:
+                response = route(body)
+            self._respond(200, response)
+        except RequestError as e:
+            self._respond(e.status, {'error' : str(e)})
+        except Exception as e:
+            logger.exception(e)
+            self._respond(500, {'error' : str(e)})
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class Server():
+    """JSON over HTTP server around a PipelineAI.
+
+    Subclasses fill ``routes`` with ``(method, path) -> handler(body)`` and
+    may set ``batcher`` to a MicroBatcher, which is started and closed with
+    the server. ``concurrency`` bounds the requests handled at once and
+    keep-alive connections idle for ``idle_timeout`` seconds are closed.
+    """
+
+    def __init__(self, pipeline, concurrency = 64, idle_timeout = 5.0):
+        self.pipeline = pipeline
+        self.concurrency = concurrency
+        self.idle_timeout = idle_timeout
+        self.batcher = None
+        self.routes = {('GET', '/health') : self.health}
+        self.httpd = None
+        self.thread = None
+
+    def health(self, body):
+        return {'status' : 'ok'}
+
+    def image(self, value):
+        if value is None:
+            raise RequestError('Missing image')
+        try:
+            image = np.asarray(value)
+        except ValueError as e:
+            raise RequestError('Invalid image: {error}'.format(error = e))
+        if image.dtype.kind not in 'biuf' or image.ndim == 0:
+            raise RequestError('Invalid image: expected a nested list of numbers')
+        return image
+
+    def _bind(self, host, port):
+        self.httpd = _HTTPServer((host, port), _Handler, self, self.concurrency, self.idle_timeout)
+        if self.batcher is not None:
+            self.batcher.start()
+        return self.httpd.server_address
+
+    def run(self, host = "0.0.0.0", port = 3000):
+        """Serves requests until interrupted."""
+        host, port = self._bind(host, port)
+        logger.info("Serving {name} on {host}:{port}".format(name = type(self).__name__, host = host, port = port))
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.httpd.server_close()
+            if self.batcher is not None:
+                self.batcher.close()
+
+    def start(self, host = "127.0.0.1", port = 0):
+        """Serves requests on a background thread, returns (host, port)."""
+        address = self._bind(host, port)
+        self.thread = Thread(target = self.httpd.serve_forever, daemon = True)
+        self.thread.start()
+        return address
+
+    def shutdown(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+        if self.batcher is not None:
+            self.batcher.close()
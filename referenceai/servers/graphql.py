@@ -0,0 +1,360 @@
+import re
+import numpy as np
+from concurrent.futures import Future
+from loguru import logger
+
+from ..fingerprint import fingerprint
+from .base import Server, RequestError
+
+
+class GraphQLError(Exception):
+    pass
+
+
+_TOKEN = re.compile(r'''
+    (?P<skip>[\s,]+|\#[^\n]*)
+  | (?P<punct>\.\.\.|[{}()\[\]:!$=@])
+  | (?P<number>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<string>"(?:[^"\\\n]|\\.)*")
+  | (?P<name>[_A-Za-z][_0-9A-Za-z]*)
+''', re.VERBOSE)
+
+_ESCAPES = {'"' : '"', '\\' : '\\', '/' : '/', 'b' : '\b', 'f' : '\f', 'n' : '\n', 'r' : '\r', 't' : '\t'}
+
+
+def _tokenize(source):
+    tokens = []
+    pos = 0
+    while pos < len(source):
+        match = _TOKEN.match(source, pos)
+        if match is None:
+            raise GraphQLError('Unexpected character {char!r} at {pos}'.format(char = source[pos], pos = pos))
+        kind = match.lastgroup
+        if kind != 'skip':
+            tokens.append((kind, match.group(kind)))
+        pos = match.end()
+    tokens.append(('eof', None))
+    return tokens
+
+
+class Field():
+    __slots__ = ('alias', 'name', 'arguments')
+
+    def __init__(self, alias, name, arguments):
+        self.alias = alias
+        self.name = name
+        self.arguments = arguments
+
+
+class Operation():
+    __slots__ = ('kind', 'name', 'defaults', 'fields')
+
+    def __init__(self, kind, name, defaults, fields):
+        self.kind = kind
+        self.name = name
+        self.defaults = defaults
+        self.fields = fields
+
+
+class _Variable():
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+
+class Parser():
+    """Parses the subset of GraphQL needed to call pipeline rings.
+
+    Supports anonymous and named query/mutation operations, aliases,
+    arguments with literal or variable values and variable definitions with
+    defaults. Fields are flat: every ring returns a scalar or a list, so
+    nested selection sets, fragments and directives are rejected.
+    """
+
+    def __init__(self, source):
+        self.tokens = _tokenize(source)
+        self.pos = 0
+
+    def _peek(self):
+        return self.tokens[self.pos]
+
+    def _next(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def _expect(self, kind, value = None):
+        token = self._next()
+        if token[0] != kind or (value is not None and token[1] != value):
+            raise GraphQLError('Expected {expected}, found {found}'.format(
+                expected = value or kind, found = token[1] or token[0]))
+        return token[1]
+
+    def _accept(self, kind, value):
+        if self._peek() == (kind, value):
+            self.pos += 1
+            return True
+        return False
+
+    def parse(self):
+        operations = []
+        while self._peek()[0] != 'eof':
+            operations.append(self._operation())
+        if len(operations) == 0:
+            raise GraphQLError('Document does not contain an operation')
+        return operations
+
+    def _operation(self):
+        kind, name, defaults = 'query', None, {}
+        if self._peek() in (('name', 'query'), ('name', 'mutation')):
+            kind = self._next()[1]
+            if self._peek()[0] == 'name':
+                name = self._next()[1]
+            if self._accept('punct', '('):
+                while not self._accept('punct', ')'):
+                    self._expect('punct', '$')
+                    variable = self._expect('name')
+                    self._expect('punct', ':')
+                    self._type()
+                    if self._accept('punct', '='):
+                        defaults[variable] = self._value()
+        elif self._peek()[0] == 'name':
+            raise GraphQLError('Unsupported operation {name}'.format(name = self._peek()[1]))
+        return Operation(kind, name, defaults, self._selections())
+
+    def _type(self):
+        if self._accept('punct', '['):
+            self._type()
+            self._expect('punct', ']')
+        else:
+            self._expect('name')
+        self._accept('punct', '!')
+
+    def _selections(self):
+        self._expect('punct', '{')
+        fields = []
+        while not self._accept('punct', '}'):
+            if self._peek()[0] != 'name':
+                raise GraphQLError('Expected a field, found {found}'.format(found = self._peek()[1] or 'eof'))
+            alias = name = self._next()[1]
+            if self._accept('punct', ':'):
+                name = self._expect('name')
+            arguments = {}
+            if self._accept('punct', '('):
+                while not self._accept('punct', ')'):
+                    argument = self._expect('name')
+                    self._expect('punct', ':')
+                    arguments[argument] = self._value()
+            if self._peek() == ('punct', '{'):
+                raise GraphQLError('Field {name} does not have subfields'.format(name = name))
+            fields.append(Field(alias, name, arguments))
+        return fields
+
+    def _value(self):
+        kind, value = self._next()
+        if kind == 'number':
+            return float(value) if any(c in value for c in '.eE') else int(value)
+        if kind == 'string':
+            return re.sub(r'\\(u[0-9a-fA-F]{4}|.)', lambda m: chr(int(m.group(1)[1:], 16))
+                          if m.group(1)[0] == 'u' else _ESCAPES.get(m.group(1), m.group(1)), value[1:-1])
+        if kind == 'name':
+            return {'true' : True, 'false' : False, 'null' : None}.get(value, value)
+        if (kind, value) == ('punct', '$'):
+            return _Variable(self._expect('name'))
+        if (kind, value) == ('punct', '['):
+            values = []
+            while not self._accept('punct', ']'):
+                values.append(self._value())
+            return values
+        if (kind, value) == ('punct', '{'):
+            values = {}
+            while not self._accept('punct', '}'):
+                key = self._expect('name')
+                self._expect('punct', ':')
+                values[key] = self._value()
+            return values
+        raise GraphQLError('Unexpected {value}'.format(value = value or kind))
+
+
+def parse(source):
+    return Parser(source).parse()
+
+
+def _substitute(value, variables):
+    if isinstance(value, _Variable):
+        if value.name not in variables:
+            raise GraphQLError('Variable ${name} is not defined'.format(name = value.name))
+        return variables[value.name]
+    if isinstance(value, list):
+        return [_substitute(v, variables) for v in value]
+    if isinstance(value, dict):
+        return {k : _substitute(v, variables) for k, v in value.items()}
+    return value
+
+
+class DataLoader():
+    """Collects the keys loaded while resolving one operation and fetches
+    them on ``dispatch`` with one ``batch_fn`` call per key shape.
+
+    Identical keys are loaded once. ``batch_fn`` gets unique keys of the
+    same shape in load order and returns their results in the same order;
+    if it raises, only the futures of that call fail.
+    """
+
+    def __init__(self, batch_fn):
+        self.batch_fn = batch_fn
+        self.pending = {}
+
+    def load(self, key) -> Future:
+        fp = fingerprint(key)
+        if fp is None:
+            # no fingerprint, never merged with other keys
+            fp = object()
+        if fp not in self.pending:
+            self.pending[fp] = (key, Future())
+        return self.pending[fp][1]
+
+    def dispatch(self):
+        pending, self.pending = self.pending, {}
+        if len(pending) == 0:
+            return
+        groups = {}
+        for key, future in pending.values():
+            groups.setdefault(np.shape(key), []).append((key, future))
+        for loads in groups.values():
+            try:
+                results = self.batch_fn([key for key, _ in loads])
+            except Exception as e:
+                logger.exception(e)
+                for _, future in loads:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(loads, results):
+                future.set_result(result)
+
+
+class GraphQLServer(Server):
+    """Serves the rings of a PipelineAI as GraphQL fields on POST /graphql.
+
+    query    { classify(image: ...)  classify_batch(images: ...)  health }
+    mutation { train  update(image: ..., label: ...)  update_bulk(images: ..., labels: [...]) }
+
+    All classify and classify_batch fields of a query are resolved through a
+    DataLoader with one ``map`` of the classify_batch ring: images classified
+    before, by any query, come from the GraphRing cache and the others are
+    classified in one batch per image shape. A field whose batch fails is
+    null and reported in ``errors`` with its path, the other fields still
+    resolve. Mutations run one after the other in document order and
+    return true.
+    """
+
+    def __init__(self, pipeline, **kwargs):
+        super().__init__(pipeline, **kwargs)
+        self.routes[('POST', '/graphql')] = self.graphql
+        self.queries = {
+            'health' : lambda loader, args: 'ok',
+            'classify' : self._classify,
+            'classify_batch' : self._classify_batch,
+        }
+        self.mutations = {
+            'train' : self._train,
+            'update' : self._update,
+            'update_bulk' : self._update_bulk,
+        }
+
+    def _argument(self, args, name):
+        if name not in args:
+            raise GraphQLError('Missing argument "{name}"'.format(name = name))
+        return self.image(args[name])
+
+    def _classify(self, loader, args):
+        return loader.load(self._argument(args, 'image'))
+
+    def _classify_batch(self, loader, args):
+        images = self._argument(args, 'images')
+        return [loader.load(image) for image in images]
+
+    def _train(self, args):
+        self.pipeline.train()
+        return True
+
+    def _label(self, args, name):
+        if name not in args:
+            raise GraphQLError('Missing argument "{name}"'.format(name = name))
+        return args[name]
+
+    def _update(self, args):
+        self.pipeline.update(self._argument(args, 'image'), self._label(args, 'label'))
+        return True
+
+    def _update_bulk(self, args):
+        labels = self._label(args, 'labels')
+        if not isinstance(labels, list):
+            raise GraphQLError('"labels" must be a list')
+        self.pipeline.update_bulk(self._argument(args, 'images'), labels)
+        return True
+
+    def graphql(self, body):
+        if not isinstance(body, dict) or not isinstance(body.get('query'), str):
+            raise RequestError('Expected a JSON object with a "query" string')
+        try:
+            data, errors = self._execute(body['query'], body.get('variables'), body.get('operationName'))
+        except (GraphQLError, RequestError) as e:
+            return {'data' : None, 'errors' : [{'message' : str(e)}]}
+        if len(errors) > 0:
+            return {'data' : data, 'errors' : errors}
+        return {'data' : data}
+
+    def execute(self, source, variables = None, operation_name = None):
+        """Returns the data of an operation, raises GraphQLError on the first field error."""
+        data, errors = self._execute(source, variables, operation_name)
+        if len(errors) > 0:
+            raise GraphQLError(errors[0]['message'])
+        return data
+
+    def _execute(self, source, variables, operation_name):
+        operations = parse(source)
+        if operation_name is not None:
+            operations = [o for o in operations if o.name == operation_name]
+        if len(operations) != 1:
+            raise GraphQLError('Expected exactly one operation, found {count}'.format(count = len(operations)))
+        operation = operations[0]
+        variables = dict(operation.defaults, **(variables or {}))
+        if operation.kind == 'mutation':
+            return self._mutate(operation, variables)
+        return self._query(operation, variables)
+
+    def _resolvers(self, fields, resolvers):
+        for field in fields:
+            if field.name not in resolvers:
+                raise GraphQLError('Unknown field {name}'.format(name = field.name))
+        return [(field, resolvers[field.name]) for field in fields]
+
+    def _query(self, operation, variables):
+        loader = DataLoader(lambda images: self.pipeline.map("classify_batch", images))
+        pending = {}
+        for field, resolve in self._resolvers(operation.fields, self.queries):
+            pending[field.alias] = resolve(loader, _substitute(field.arguments, variables))
+        loader.dispatch()
+
+        def result(value):
+            if isinstance(value, Future):
+                return value.result()
+            if isinstance(value, list):
+                return [result(v) for v in value]
+            return value
+        data, errors = {}, []
+        for alias, value in pending.items():
+            try:
+                data[alias] = result(value)
+            except Exception as e:
+                data[alias] = None
+                errors.append({'message' : str(e), 'path' : [alias]})
+        return data, errors
+
+    def _mutate(self, operation, variables):
+        data = {}
+        for field, resolve in self._resolvers(operation.fields, self.mutations):
+            data[field.alias] = resolve(_substitute(field.arguments, variables))
+        return data, []
@@ -0,0 +1,39 @@
+from .base import Server, RequestError
+
+
+class RESTServer(Server):
+    """Serves a PipelineAI over JSON endpoints.
+
+    GET  /health                               -> {"status": "ok"}
+    POST /classify        {"image": [...]}     -> {"label": ...}
+    POST /classify_batch  {"images": [[...]]}  -> {"labels": [...]}
+
+    Every inference goes through a MicroBatcher of ``workers`` threads, so
+    the model stays loaded in this process and concurrent requests share
+    batched calls of at most ``max_batch_size`` images.
+    """
+
+    def __init__(self, pipeline, workers = 1, max_batch_size = 32, max_latency = 0.005, **kwargs):
+        super().__init__(pipeline, **kwargs)
+        self.batcher = pipeline.micro_batcher(max_batch_size = max_batch_size, max_latency = max_latency, workers = workers)
+        self.routes[('POST', '/classify')] = self.classify
+        self.routes[('POST', '/classify_batch')] = self.classify_batch
+
+    def classify_many(self, images):
+        futures = [self.batcher.submit(image) for image in images]
+        return [future.result() for future in futures]
+
+    def _field(self, body, name):
+        if not isinstance(body, dict) or name not in body:
+            raise RequestError('Expected a JSON object with "{name}"'.format(name = name))
+        return body[name]
+
+    def classify(self, body):
+        image = self.image(self._field(body, 'image'))
+        return {'label' : self.classify_many([image])[0]}
+
+    def classify_batch(self, body):
+        images = self._field(body, 'images')
+        if not isinstance(images, list):
+            raise RequestError('"images" must be a list')
+        return {'labels' : self.classify_many([self.image(image) for image in images])}
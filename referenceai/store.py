@@ -0,0 +1,159 @@
+import os
+from os import path, makedirs
+import pickle
+import hashlib as hl
+from shutil import rmtree
+from loguru import logger
+
+
+class Segment():
+    """Outputs of a cached edge stored on disk, read on first access."""
+
+    __slots__ = ('path', 'count')
+
+    def __init__(self, path, count):
+        self.path = path
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def load(self):
+        with open(self.path, "rb") as f:
+            return pickle.load(f)
+
+
+class LazyValue():
+    """Output published at the root node, restored from a blob and read the
+    first time a ring resolves it. ``type`` is known without reading it."""
+
+    __slots__ = ('segment', 'type', 'value', 'loaded')
+
+    def __init__(self, segment, type):
+        self.segment = segment
+        self.type = type
+        self.value = None
+        self.loaded = False
+
+    def get(self):
+        if not self.loaded:
+            self.value = self.segment.load()
+            self.loaded = True
+        return self.value
+
+
+def type_of(value):
+    return value.type if isinstance(value, LazyValue) else type(value)
+
+
+class SegmentStore():
+    """Append-only on-disk store for the cache of a GraphRing.
+
+    Every cached edge output lives in its own blob, named after its cache
+    key, next to a small manifest listing the entries, the outputs published
+    at the root node and the run history. Blobs are content addressed, so a
+    save only writes the entries that are not on disk yet, and a load only
+    reads the manifest: cache entries come back as Segments and root
+    outputs as LazyValues, both read when a ring first uses them.
+    """
+
+    manifest_filename = "manifest"
+    blobs_dirname = "blobs"
+
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self.blobs_path = path.join(base_path, self.blobs_dirname)
+        self.manifest_path = path.join(base_path, self.manifest_filename)
+
+    def exists(self):
+        return path.exists(self.manifest_path)
+
+    def clear(self):
+        if path.isdir(self.base_path):
+            rmtree(self.base_path)
+        elif path.exists(self.base_path):
+            os.remove(self.base_path)
+
+    def _blob(self, name):
+        return path.join(self.blobs_path, name)
+
+    def _write(self, filename, obj):
+        # write to a temporary file first so readers never see partial blobs
+        tmp = filename + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                pickle.dump(obj, f, protocol = pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, filename)
+        finally:
+            if path.exists(tmp):
+                os.remove(tmp)
+
+    def _put(self, name, obj):
+        """Writes obj unless the blob already exists. Returns False when obj
+        can not be pickled."""
+        filename = self._blob(name)
+        if path.exists(filename):
+            return True
+        try:
+            self._write(filename, obj)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            logger.warning("Unable to persist {name}: {error}".format(name = name, error = e))
+            return False
+        return True
+
+    def save(self, ring, runs):
+        with ring.lock:
+            self._save(ring, runs)
+
+    def _save(self, ring, runs):
+        if path.isfile(self.base_path):
+            # single file pickle written by older versions
+            os.remove(self.base_path)
+        if not path.exists(self.blobs_path):
+            makedirs(self.blobs_path)
+
+        entries = []
+        for key, outputs in ring.cache.entries.items():
+            name = hl.sha256(repr(key).encode('utf-8')).hexdigest()
+            if isinstance(outputs, Segment) or self._put(name, outputs):
+                entries.append((key, name, len(outputs), ring.cache.sizes[key]))
+
+        root = []
+        for value, fp in ring.meta.nodes['root']['outputs']:
+            if fp is None:
+                # derived from a value without fingerprint, never reused
+                continue
+            name = "root-" + fp
+            if isinstance(value, LazyValue):
+                if value.loaded:
+                    value = value.value
+                elif not path.exists(self._blob(name)):
+                    # never read and its blob is gone with a cleared store
+                    continue
+            if isinstance(value, LazyValue) or self._put(name, value):
+                root.append((name, fp, type_of(value)))
+
+        referenced = set(e[1] for e in entries) | set(r[0] for r in root)
+        for name in os.listdir(self.blobs_path):
+            if name not in referenced:
+                os.remove(self._blob(name))
+
+        self._write(self.manifest_path, {
+            'entries' : entries,
+            'root' : root,
+            'runs' : runs})
+
+    def load(self, ring):
+        """Restores the cache of ring and returns the saved run history."""
+        with open(self.manifest_path, "rb") as f:
+            manifest = pickle.load(f)
+
+        for key, name, count, size in manifest['entries']:
+            ring.cache.restore(key, Segment(self._blob(name), count), size)
+
+        outputs = []
+        for name, fp, output_type in manifest['root']:
+            outputs.append((LazyValue(Segment(self._blob(name), 1), output_type), fp))
+        ring.meta.nodes['root']['outputs'] = outputs
+
+        return manifest['runs']
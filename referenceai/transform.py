@@ -13,4 +13,41 @@ class Transform():
 
     @abstractmethod
     def inverse_transform(self, data: np.ndarray) -> np.ndarray:
-        pass
\ No newline at end of file
+        pass
+
+
+class CategoricalTransform(Transform):
+    """One-hot encoding of categorical labels with plain NumPy.
+
+    ``forward_transform`` turns a vector of labels into a dense
+    ``(n, categories)`` array of ``dtype`` and ``inverse_transform`` decodes
+    rows back to labels with an argmax, so it also accepts class scores such
+    as the output of a softmax layer.
+    """
+
+    def __init__(self, dtype = np.float32):
+        self.dtype = np.dtype(dtype)
+        self.categories = None
+
+    def fit(self, data: np.ndarray):
+        self.categories = np.unique(np.asarray(data).ravel())
+        return self
+
+    def indices(self, data: np.ndarray) -> np.ndarray:
+        data = np.asarray(data).ravel()
+        idx = np.searchsorted(self.categories, data)
+        idx[idx == len(self.categories)] = 0
+        unknown = self.categories[idx] != data
+        if np.any(unknown):
+            raise ValueError('Unknown categories {categories}'.format(categories = np.unique(data[unknown])))
+        return idx
+
+    def forward_transform(self, data: np.ndarray) -> np.ndarray:
+        idx = self.indices(data)
+        onehot = np.zeros((len(idx), len(self.categories)), dtype = self.dtype)
+        onehot[np.arange(len(idx)), idx] = 1
+        return onehot
+
+    def inverse_transform(self, data: np.ndarray) -> np.ndarray:
+        data = np.asarray(data)
+        return self.categories[np.argmax(np.reshape(data, (-1, data.shape[-1])), axis = 1)]
@@ -0,0 +1,86 @@
+import sys
+import importlib
+from types import ModuleType
+
+
+class LazyModule(ModuleType):
+    """Module proxy that imports the real module on first attribute access."""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name) -> LazyModule:
+    """Returns name if it is already imported, a LazyModule otherwise."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
+
+
+class LazyType(type):
+    """Stand-in for a class of a module that is not imported yet.
+
+    GraphRing resolves edge arguments with issubclass on the annotated types,
+    so annotations must be classes. A LazyType can be used as one without
+    importing its module: as long as the module is not imported nothing can
+    be an instance of the class, so subclass and instance checks answer
+    False without importing anything. Once the module is imported they are
+    delegated to the real class. Checks against the real class itself do not
+    know about the stand-in, so annotate producers and consumers alike with
+    the same LazyType.
+    """
+
+    def __new__(mcs, module, qualname):
+        cls = super().__new__(mcs, qualname.rsplit('.', 1)[-1], (), {})
+        cls._target = (module, qualname)
+        cls.__module__ = module
+        cls.__qualname__ = qualname
+        return cls
+
+    def __init__(cls, module, qualname):
+        super().__init__(qualname.rsplit('.', 1)[-1], (), {})
+
+    def loaded(cls):
+        return cls._target[0] in sys.modules
+
+    def resolve(cls):
+        obj = importlib.import_module(cls._target[0])
+        for attr in cls._target[1].split('.'):
+            obj = getattr(obj, attr)
+        return obj
+
+    def __subclasscheck__(cls, subclass):
+        if isinstance(subclass, LazyType):
+            if subclass._target == cls._target:
+                return True
+            if not subclass.loaded():
+                return False
+            subclass = subclass.resolve()
+        if not cls.loaded():
+            return False
+        return issubclass(subclass, cls.resolve())
+
+    def __instancecheck__(cls, instance):
+        return cls.__subclasscheck__(type(instance))
+
+    def __repr__(cls):
+        return "<lazy class '{module}.{qualname}'>".format(module = cls._target[0], qualname = cls._target[1])
+
+
+def lazy_type(module, qualname) -> LazyType:
+    return LazyType(module, qualname)
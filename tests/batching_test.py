@@ -0,0 +1,34 @@
+from referenceai.batching import MicroBatcher
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+
+def test_micro_batcher_groups_requests():
+    batches = []
+
+    def double(items):
+        batches.append(len(items))
+        return items * 2
+
+    with MicroBatcher(double, max_batch_size = 8, max_latency = 0.05) as batcher:
+        with ThreadPoolExecutor(max_workers = 16) as pool:
+            results = list(pool.map(batcher, [np.array([i]) for i in range(16)]))
+
+    assert([r.tolist() for r in results] == [[i * 2] for i in range(16)])
+    assert(sum(batches) == 16)
+    assert(max(batches) <= 8 and len(batches) < 16)
+
+def test_micro_batcher_propagates_errors():
+    def fail(items):
+        raise ValueError("bad batch")
+
+    with MicroBatcher(fail) as batcher:
+        with pytest.raises(ValueError):
+            batcher(np.zeros(2))
+
+def test_micro_batcher_isolates_shapes():
+    with MicroBatcher(lambda items: items.sum(axis = 1), max_batch_size = 8, max_latency = 0.05) as batcher:
+        good = [batcher.submit(np.ones(2)) for _ in range(3)]
+        bad = batcher.submit(np.ones(3))
+        assert([f.result() for f in good] == [2, 2, 2])
+        assert(bad.result() == 3)
@@ -0,0 +1,16 @@
+from benchmarks.__main__ import main, compare
+import json
+
+def test_compare():
+    baseline = {"t" : {"value" : 1.0, "unit" : "s"}, "q" : {"value" : 100.0, "unit" : "items/s"}}
+    assert(compare({"t" : {"value" : 1.1, "unit" : "s"}, "q" : {"value" : 90.0, "unit" : "items/s"}}, baseline, 0.2) == [])
+    regressions = compare({"t" : {"value" : 2.0, "unit" : "s"}, "q" : {"value" : 50.0, "unit" : "items/s"}}, baseline, 0.2)
+    assert([r[0] for r in regressions] == ["t", "q"])
+
+def test_benchmarks_run(tmp_path):
+    output = str(tmp_path / "results.json")
+    assert(main(["--only", "run_latency", "idx", "--repeat", "1", "--output", output]) == 0)
+    with open(output) as f:
+        results = json.load(f)["results"]
+    assert({"run.cold", "run.cached", "idx.open", "idx.read"} <= set(results))
+    assert(main(["--only", "run_latency", "--repeat", "1", "--baseline", output, "--threshold", "1000"]) == 0)
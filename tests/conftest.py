@@ -0,0 +1,85 @@
+from referenceai.pipeline import PipelineAI, PipelineAIProvider
+from referenceai.datasource import DataSource
+from referenceai.transform import Transform, CategoricalTransform
+import numpy as np
+import pytest
+
+class MeanModel():
+    """Classifies images as bright (1) or dark (0) by their mean intensity."""
+
+    def __init__(self):
+        self.threshold = None
+        self.finetuned = []
+
+    def predict(self, images: np.ndarray) -> np.ndarray:
+        means = images.reshape(len(images), -1).mean(axis = 1)
+        return np.stack([means < self.threshold, means >= self.threshold], axis = 1).astype(np.float32)
+
+class MeanDataSource(DataSource):
+    def train_set(self):
+        return np.zeros((2, 4, 4), dtype = np.uint8), np.array([0, 1])
+
+    def test_set(self):
+        return self.train_set()
+
+class MeanProvider(PipelineAIProvider):
+    def __init__(self, ds):
+        self.ds = ds
+        self.transforms = 0
+
+    def hyperparameters(self) -> dict:
+        return {"threshold" : 0.5, "finetune_steps" : 3, "replay" : 2}
+
+    def model(self) -> MeanModel:
+        return MeanModel()
+
+    def datasource(self) -> DataSource:
+        return self.ds
+
+    def transform(self, ds: DataSource) -> (DataSource, Transform):
+        self.transforms += 1
+        return ds, CategoricalTransform().fit(ds.train_set()[1])
+
+    def train(self, ds: DataSource, model: MeanModel, hyperparameters: dict, t: Transform) -> (MeanModel, Transform):
+        model.threshold = hyperparameters["threshold"]
+        return model, t
+
+    def transform_one(self, image: np.ndarray) -> np.ndarray:
+        return self.transform_batch(np.array([image]))
+
+    def transform_batch(self, images: np.ndarray) -> np.ndarray:
+        return np.asarray(images, dtype = np.float32) / 255
+
+    def classify(self, model: MeanModel, images: np.ndarray) -> np.ndarray:
+        return model.predict(images)
+
+    def inverse_transform_one(self, labels: np.ndarray, t: Transform) -> int:
+        return int(t.inverse_transform(labels)[0])
+
+    def inverse_transform_batch(self, labels: np.ndarray, t: Transform) -> list:
+        return [int(label) for label in t.inverse_transform(labels)]
+
+    def finetune(self, ds: DataSource, model: MeanModel, hyperparameters: dict, t: Transform) -> (MeanModel, Transform):
+        for x, y in ds.finetune_batches(hyperparameters["finetune_steps"], hyperparameters["replay"], seed = 0):
+            model.finetuned.append((len(x), list(y)))
+        ds.updates.commit()
+        return model, t
+
+    def updatesource(self, ds: DataSource, image: np.ndarray, label: int) -> DataSource:
+        ds.updates.append(image, label)
+        return ds
+
+    def updatesource_bulk(self, ds: DataSource, images: np.ndarray, labels: list) -> DataSource:
+        ds.updates.extend(images, labels)
+        return ds
+
+@pytest.fixture
+def ai(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return PipelineAI("test-ai", MeanProvider(MeanDataSource("mean", base_path = str(tmp_path / "dataset"))))
+
+@pytest.fixture
+def images():
+    dark = np.full((4, 4), 20, dtype = np.uint8)
+    bright = np.full((4, 4), 230, dtype = np.uint8)
+    return [dark, bright, bright, dark]
@@ -0,0 +1,114 @@
+from referenceai.dataset.cache import DatasetCache, IntegrityError, sha256_file
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Thread
+import hashlib as hl
+import gzip
+import json
+import os
+import numpy as np
+import pytest
+
+@pytest.fixture
+def server():
+    payload = os.urandom(100000)
+    served = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            start = 0
+            if "Range" in self.headers:
+                start = int(self.headers["Range"].split("=")[1].rstrip("-"))
+                if start >= len(payload):
+                    self.send_response(416)
+                    self.send_header("Content-Range", "bytes */%d" % len(payload))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(206)
+            else:
+                self.send_response(200)
+            self.send_header("Content-Length", str(len(payload) - start))
+            self.end_headers()
+            self.wfile.write(payload[start:])
+            served.append(len(payload) - start)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = HTTPServer(("127.0.0.1", 0), Handler)
+    Thread(target = httpd.serve_forever, daemon = True).start()
+    yield "http://127.0.0.1:%d/data" % httpd.server_address[1], payload, served
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_fetch_decompresses_once(tmp_path):
+    source = tmp_path / "source.gz"
+    with gzip.open(str(source), "wb") as f:
+        f.write(b"idx" * 1000)
+
+    cache = DatasetCache(str(tmp_path / "cache"))
+    filename = cache.fetch(source.as_uri(), os.path.join("train", "data"), decompress = True)
+    with open(filename, "rb") as f:
+        assert(f.read() == b"idx" * 1000)
+    with open(str(tmp_path / "cache" / "manifest.json")) as f:
+        entry = json.load(f)[os.path.join("train", "data")]
+    assert(entry["sha256"] == hl.sha256(b"idx" * 1000).hexdigest())
+
+    os.remove(str(source))
+    assert(DatasetCache(str(tmp_path / "cache")).fetch(source.as_uri(), os.path.join("train", "data")) == filename)
+    assert(cache.verify(os.path.join("train", "data")))
+
+def test_fetch_resumes_partial_download(tmp_path, server):
+    url, payload, served = server
+    cache = DatasetCache(str(tmp_path))
+    with open(str(tmp_path / "data.part"), "wb") as f:
+        f.write(payload[:40000])
+
+    filename = cache.fetch(url, "data", sha256 = hl.sha256(payload).hexdigest())
+    assert(served == [60000])
+    assert(sha256_file(filename) == hl.sha256(payload).hexdigest())
+
+def test_fetch_rejects_corrupt_download(tmp_path, server):
+    url, _, _ = server
+    cache = DatasetCache(str(tmp_path))
+    with pytest.raises(IntegrityError):
+        cache.fetch(url, "data", sha256 = "0" * 64)
+    assert(not os.path.exists(str(tmp_path / "data")) and cache.entry("data") is None)
+
+def test_array_fast_path(tmp_path, server):
+    url, payload, _ = server
+    cache = DatasetCache(str(tmp_path))
+    cache.fetch(url, "data")
+    calls = []
+
+    def reader(filename):
+        calls.append(filename)
+        with open(filename, "rb") as f:
+            return np.frombuffer(f.read(), dtype = np.uint8)
+
+    first = cache.array("data", reader)
+    second = DatasetCache(str(tmp_path)).array("data", reader)
+    assert(len(calls) == 1 and isinstance(second, np.memmap))
+    assert(np.array_equal(first, second) and second.tobytes() == payload)
+
+def test_fetch_completed_part(tmp_path, server):
+    url, payload, served = server
+    cache = DatasetCache(str(tmp_path))
+    # the process died after the download finished, before the rename
+    with open(str(tmp_path / "data.part"), "wb") as f:
+        f.write(payload)
+    filename = cache.fetch(url, "data")
+    assert(served == [] and sha256_file(filename) == hl.sha256(payload).hexdigest())
+
+    # a part longer than the file is fetched again
+    with open(str(tmp_path / "other.part"), "wb") as f:
+        f.write(payload + b"x")
+    filename = cache.fetch(url, "other")
+    assert(served == [len(payload)] and sha256_file(filename) == hl.sha256(payload).hexdigest())
+
+def test_fetch_discards_corrupt_gzip(tmp_path, server):
+    url, _, _ = server
+    cache = DatasetCache(str(tmp_path))
+    with pytest.raises(OSError):
+        cache.fetch(url, "data", decompress = True)
+    assert(not os.path.exists(str(tmp_path / "data.part")))
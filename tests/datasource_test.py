@@ -0,0 +1,94 @@
+from referenceai.datasource import DataSource, BatchIterator
+import numpy as np
+import pytest
+
+class ArrayDataSource(DataSource):
+    def __init__(self, x, y, base_path):
+        super().__init__("arrays", base_path = base_path)
+        self.x = x
+        self.y = y
+
+    def train_set(self):
+        return self.x, self.y
+
+    def test_set(self):
+        return self.x[:10], self.y[:10]
+
+@pytest.fixture
+def ds(tmp_path):
+    x = np.arange(100 * 4).reshape(100, 4)
+    y = np.arange(100)
+    return ArrayDataSource(x, y, str(tmp_path))
+
+def test_batches_cover_epoch(ds):
+    batches = ds.batches(batch_size = 32, seed = 1)
+    assert(len(batches) == 4)
+    seen = np.concatenate([y for _, y in batches])
+    assert(sorted(seen.tolist()) == list(range(100)))
+    for x, y in batches:
+        assert(np.array_equal(x[:, 0] // 4, y))
+
+def test_batches_reshuffle(ds):
+    batches = ds.batches(batch_size = 10, seed = 1)
+    first = [y.tolist() for _, y in batches]
+    second = [y.tolist() for _, y in batches]
+    assert(first != second)
+
+def test_prefetched_batches(ds):
+    batches = ds.batches('test', batch_size = 3, shuffle = False, prefetch = 2)
+    assert([y.tolist() for _, y in batches] == [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]])
+
+def test_prefetch_loader(ds):
+    from referenceai.datasource import PrefetchLoader
+    batches = ds.batches(batch_size = 16, shuffle = False)
+    loader = PrefetchLoader(batches, lambda x, y: (x * 2, y + 1), depth = 3, workers = 4)
+    assert(len(loader) == 7)
+    ys = [y for _, y in loader]
+    assert(np.array_equal(np.concatenate(ys), np.arange(100) + 1))
+    xs = [x for x, _ in loader]
+    assert(np.array_equal(np.concatenate(xs), ds.x * 2))
+
+def test_update_buffer_grows():
+    from referenceai.datasource import UpdateBuffer
+    from referenceai.dataset.storage import GrowableArray
+    buffer = UpdateBuffer(GrowableArray(2), GrowableArray(2))
+    for i in range(5):
+        buffer.append(np.full((2, 2), i, dtype = np.uint8), i)
+    buffer.extend(np.zeros((3, 2, 2), dtype = np.uint8), [7, 8, 9])
+
+    x, y = buffer.samples()
+    assert(len(buffer) == 8 and x.shape == (8, 2, 2) and list(y) == [0, 1, 2, 3, 4, 7, 8, 9])
+    buffer.commit(5)
+    assert(list(buffer.pending()[1]) == [7, 8, 9])
+
+def test_images_datasource_appends(tmp_path, monkeypatch):
+    from referenceai.datasource import ImagesDataSource, ImageScheme
+    monkeypatch.chdir(tmp_path)
+
+    class Images(ImagesDataSource):
+        def train_set(self):
+            return np.zeros((3, 2, 2), dtype = np.uint8), np.zeros(3, dtype = np.uint8)
+
+        def images(self):
+            return self.train_set()[0]
+
+    ds = Images("images", ImageScheme.BW)
+    ds.updates.extend(np.full((5, 2, 2), 7, dtype = np.uint8), [1] * 5)
+    assert(ds.num_images() == 8)
+    assert(ds.image(4).tolist() == [[7, 7], [7, 7]])
+
+    # appended images are stored on disk
+    assert(Images("images", ImageScheme.BW).num_images() == 8)
+
+    # a rejected sample leaves both stores untouched
+    with pytest.raises(ValueError):
+        ds.updates.append(np.ones((3, 3), dtype = np.uint8), 2)
+    ds.updates.append(np.ones((2, 2), dtype = np.uint8), 5)
+    ds = Images("images", ImageScheme.BW)
+    assert(len(ds.updates.y) == len(ds.updates) == 6)
+    assert(ds.updates.samples(5)[1].tolist() == [5])
+
+    # trained samples stay trained after a restart
+    ds.updates.commit()
+    ds = Images("images", ImageScheme.BW)
+    assert(ds.updates.trained == 6 and len(ds.updates.pending()[0]) == 0)
@@ -0,0 +1,51 @@
+from referenceai.fingerprint import Fingerprinter, fingerprint
+import numpy as np
+
+def test_ndarray_fingerprint():
+    a = np.arange(28*28, dtype=np.uint8).reshape(28, 28)
+    assert(fingerprint(a) == fingerprint(a.copy()))
+    assert(fingerprint(a) != fingerprint(a.T))
+    assert(fingerprint(a) != fingerprint(a.astype(np.int32)))
+    assert(fingerprint(a[::2]) == fingerprint(np.ascontiguousarray(a[::2])))
+
+def test_sampled_fingerprint():
+    f = Fingerprinter(sample_threshold = 1024, sample_count = 4, sample_bytes = 16)
+    a = np.zeros(1 << 16, dtype=np.uint8)
+    b = a.copy()
+    b[-1] = 1
+    assert(f(a) == f(a.copy()))
+    assert(f(a) != f(b))
+
+def test_registered_fingerprint():
+    class Point():
+        def __init__(self, x):
+            self.x = x
+
+    f = Fingerprinter()
+    f.register(Point, lambda fp, m, value: fp.update(m, value.x))
+    assert(f(Point(1)) == f(Point(1)))
+    assert(f(Point(1)) != f(Point(2)))
+
+def test_container_fingerprint():
+    a = np.zeros(10000)
+    b = a.copy()
+    b[5000] = 1
+    assert(repr({'x' : a}) == repr({'x' : b}))
+    assert(fingerprint({'x' : a}) != fingerprint({'x' : b}))
+    assert(fingerprint({'x' : 1, 'y' : 2}) == fingerprint({'y' : 2, 'x' : 1}))
+    assert(fingerprint({1, 2, 3}) == fingerprint({3, 2, 1}))
+    assert(fingerprint({1, 2}) != fingerprint(frozenset({1, 2})))
+
+class Box():
+    def __init__(self, value):
+        self.value = value
+
+def test_unknown_type_fingerprint():
+    box = Box(1)
+    before = fingerprint(box)
+    box.value = 2
+    assert(fingerprint(box) != before)
+    assert(fingerprint(Box(2)) == fingerprint(box))
+    # lambdas can not be pickled
+    assert(fingerprint(lambda: 1) is None)
+    assert(fingerprint([1, lambda: 1]) is None)
@@ -0,0 +1,76 @@
+from referenceai.dataset.idx import read_idx, read_idx_header
+import numpy as np
+import pytest
+import os
+
+def write_idx(filename, array):
+    codes = {np.dtype(np.uint8) : 0x08}
+    with open(filename, 'wb') as f:
+        f.write(bytes([0, 0, codes[array.dtype], array.ndim]))
+        f.write(np.array(array.shape, dtype='>u4').tobytes())
+        f.write(array.tobytes())
+
+def test_read_idx_images(tmp_path):
+    images = np.random.randint(0, 255, size=(10, 28, 28), dtype=np.uint8)
+    filename = str(tmp_path / "images")
+    write_idx(filename, images)
+
+    header, array = read_idx(filename)
+    assert(header.magic == 2051)
+    assert(header.shape == (10, 28, 28))
+    assert(isinstance(array, np.memmap))
+    assert(np.array_equal(array, images))
+
+def test_read_idx_labels(tmp_path):
+    labels = np.arange(10, dtype=np.uint8)
+    filename = str(tmp_path / "labels")
+    write_idx(filename, labels)
+
+    header, array = read_idx(filename)
+    assert(header.magic == 2049)
+    assert(np.array_equal(array, labels))
+
+def test_invalid_idx(tmp_path):
+    filename = str(tmp_path / "invalid")
+    with open(filename, 'wb') as f:
+        f.write(b'\x01\x02\x03\x04')
+    with pytest.raises(ValueError):
+        read_idx_header(filename)
+
+def write_gz(filename, array):
+    import gzip
+    write_idx(filename, array)
+    with open(filename, 'rb') as f_in, gzip.open(filename + ".gz", 'wb') as f_out:
+        f_out.write(f_in.read())
+    return filename + ".gz"
+
+def test_read_idx_gzip(tmp_path):
+    images = np.random.randint(0, 255, size=(10, 28, 28), dtype=np.uint8)
+    filename = write_gz(str(tmp_path / "images"), images)
+
+    assert(read_idx_header(filename).shape == (10, 28, 28))
+    header, array = read_idx(filename)
+    assert(header.magic == 2051)
+    assert(np.array_equal(array, images))
+
+def test_mnist_datasource_from_gzip(tmp_path, monkeypatch):
+    from referenceai.dataset.images.mnist import MNISTImagesDataSource
+    monkeypatch.chdir(tmp_path)
+    images = np.random.randint(0, 255, size=(6, 28, 28), dtype=np.uint8)
+    labels = np.arange(6, dtype=np.uint8)
+    urls = [(tmp_path / name).as_uri() for name in
+            (write_gz(str(tmp_path / "images"), images), write_gz(str(tmp_path / "labels"), labels))]
+
+    ds = MNISTImagesDataSource("mnist")
+    ds.load_from_url(tuple(urls), test_url = tuple(urls))
+    assert(np.array_equal(ds.train_set()[0], images) and np.array_equal(ds.test_set()[1], labels))
+
+    with pytest.raises(ValueError):
+        MNISTImagesDataSource("swapped").load_from_url((urls[1], urls[0]), test_url = (urls[1], urls[0]))
+
+    # warm loads come from the .npy copies, the sources are not needed anymore
+    for url in urls:
+        os.remove(url[len("file://"):])
+    ds = MNISTImagesDataSource("mnist")
+    ds.load_from_url(tuple(urls), test_url = tuple(urls))
+    assert(isinstance(ds.train_set()[0], np.memmap) and np.array_equal(ds.train_set()[0], images))
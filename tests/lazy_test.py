@@ -0,0 +1,27 @@
+from referenceai.utils.lazy import lazy_import, lazy_type, LazyModule
+import subprocess
+import sys
+
+def test_core_does_not_import_frameworks():
+    script = "\n".join([
+        "import sys",
+        "import referenceai.graph, referenceai.pipeline, referenceai.datasource, referenceai.transform",
+        "import referenceai.servers, referenceai.dataset.images.mnist",
+        "print(sorted(m for m in ('keras', 'tensorflow') if m in sys.modules))"])
+    output = subprocess.check_output([sys.executable, "-c", script])
+    assert(output.decode().strip() == "[]")
+
+def test_lazy_type(tmp_path, monkeypatch):
+    (tmp_path / "lazy_fixture.py").write_text("class Base():\n    pass\nclass Child(Base):\n    pass\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "lazy_fixture", raising = False)
+
+    Base = lazy_type("lazy_fixture", "Base")
+    module = lazy_import("lazy_fixture")
+    assert(isinstance(module, LazyModule))
+    assert(not issubclass(dict, Base) and not isinstance(1, Base) and issubclass(Base, Base))
+    assert("lazy_fixture" not in sys.modules)
+
+    child = module.Child()
+    assert("lazy_fixture" in sys.modules)
+    assert(isinstance(child, Base) and issubclass(lazy_type("lazy_fixture", "Child"), Base))
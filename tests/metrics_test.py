@@ -0,0 +1,57 @@
+from referenceai.metrics import MetricsRegistry, Histogram
+from referenceai.pipeline import Pipeline
+import numpy as np
+import tracemalloc
+
+def test_histogram_buckets():
+    h = Histogram((1, 2))
+    for v in (0.5, 1, 1.5, 3):
+        h.observe(v)
+    samples = list(h.samples("h", ()))
+    assert([s[2] for s in samples] == [2, 3, 4, 6.0, 4])
+    assert(samples[2][1] == (("le", "+Inf"),))
+
+def test_edge_metrics(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    def size() -> int:
+        return 1024
+
+    def allocate(n: int) -> np.ndarray:
+        return np.ones(n)
+
+    metrics = MetricsRegistry(trace_memory = True)
+    p = Pipeline("test-metrics", metrics = metrics)
+    p.push("allocate", [size, allocate], revise = False)
+    try:
+        p.run("allocate")
+        p.run("allocate")
+    finally:
+        tracemalloc.stop()
+
+    allocate_name = allocate.__qualname__
+    assert(metrics.counter("rai_edge_cache_total", fn = allocate_name, result = "miss").value == 1)
+    assert(metrics.counter("rai_edge_cache_total", fn = allocate_name, result = "hit").value == 1)
+    assert(metrics.histogram("rai_edge_wall_seconds", fn = allocate_name).count == 1)
+    assert(metrics.histogram("rai_edge_output_bytes", buckets = metrics.size_buckets, fn = allocate_name).sum == 8192)
+    assert(metrics.histogram("rai_edge_peak_alloc_bytes", buckets = metrics.size_buckets, fn = allocate_name).sum >= 8192)
+    assert(metrics.histogram("rai_ring_seconds", ring = "allocate").count == 2)
+
+    # revisions record into the same registry
+    p.push("size", [size], revise = True)
+    p.run("size")
+    assert(metrics.histogram("rai_ring_seconds", ring = "size").count == 1)
+
+    text = metrics.render()
+    assert("# TYPE rai_edge_cpu_seconds histogram" in text)
+    assert('rai_edge_cache_total{fn="%s",result="hit"} 1' % allocate_name in text)
+    assert('rai_ring_seconds_bucket{ring="allocate",le="+Inf"} 2' in text)
+
+def test_peak_without_reset_peak(monkeypatch):
+    monkeypatch.delattr(tracemalloc, "reset_peak", raising = False)
+    metrics = MetricsRegistry(trace_memory = True)
+    try:
+        metrics.call(np.ones, (1024,))
+    finally:
+        tracemalloc.stop()
+    assert(metrics.histogram("rai_edge_peak_alloc_bytes", buckets = metrics.size_buckets, fn = "ones").sum >= 8192)
@@ -51,3 +51,428 @@ def test_complex_return_types(p):
     r = p.run("sample-2", 4, test_sentence)
     assert (r == test_sentence*4)
 
+
+def test_signature_memoized(p, monkeypatch):
+    import inspect
+    p.run("sample-1", 2)
+    calls = []
+    getsource = inspect.getsource
+    monkeypatch.setattr(inspect, "getsource", lambda fn: calls.append(fn) or getsource(fn))
+    assert(p.run("sample-1", 2) == test_sentence*2)
+    assert(len(calls) == 0)
+    p.rings[0].invalidate_signature()
+    assert(p.run("sample-1", 2) == test_sentence*2)
+    assert(len(calls) > 0)
+
+def test_alternating_inputs_hit_cache(p):
+    calls = []
+
+    def counting_provider(i: int) -> int:
+        calls.append(i)
+        return i
+
+    def string_provider() -> str:
+        return test_sentence
+
+    def int_string_consumer(i: int, s: str) -> str:
+        return s*i
+
+    p.push("counting", [counting_provider, string_provider, int_string_consumer], revise=False)
+    assert(p.run("counting", 2) == test_sentence*2)
+    assert(p.run("counting", 3) == test_sentence*3)
+    assert(p.run("counting", 2) == test_sentence*2)
+    assert(calls == [2, 3])
+
+    # other rings keep their cached outputs
+    assert(p.run("sample-1", 4) == test_sentence*4)
+    assert(p.run("counting", 3) == test_sentence*3)
+    assert(calls == [2, 3])
+
+def test_scoped_expunge(p):
+    calls = []
+
+    def model_provider() -> float:
+        calls.append("model")
+        return 0.5
+
+    def round_model(f: float) -> float:
+        return round(f, 1)
+
+    def scale(i: int, f: float) -> str:
+        calls.append("scale")
+        return str(i*f)
+
+    def strip(s: str) -> str:
+        return s.strip()
+
+    p.push("model", [model_provider, round_model], revise=False)
+    p.push("scale", [scale, strip], revise=False)
+    p.run("model")
+    assert(p.run("scale", 4) == "2.0")
+    assert(p.run("sample-1", 2) == test_sentence*2)
+
+    # expunging an unrelated ring keeps the model and what was derived from it
+    p.expunge("sample-1")
+    assert(p.run("scale", 4) == "2.0")
+    assert(calls == ["model", "scale"])
+
+    # expunging the model ring drops everything downstream of it
+    p.expunge("model")
+    p.run("model")
+    assert(p.run("scale", 4) == "2.0")
+    assert(calls == ["model", "scale", "model", "scale"])
+
+def test_provider_registry_priority():
+    from referenceai.graph import ProviderRegistry
+    providers = ProviderRegistry()
+    providers.append(1, "a")
+    providers.append(2, "b")
+    assert(providers.find(int) == (1, "a"))
+    providers.push(True, "c")
+    assert(providers.find(int) == (True, "c"))
+    assert(providers.find(bool) == (True, "c"))
+    providers.push(3, "d")
+    assert(providers.find(int) == (3, "d"))
+    assert(providers.find(str) is None)
+
+def test_missing_inputs_from_producers(p):
+    def words() -> list:
+        return ["a", "b", "c"]
+
+    def count(w: list) -> int:
+        return len(w)
+
+    def pick(w: list, i: int) -> str:
+        return w[i - 1]
+
+    def upper(s: str) -> str:
+        return s.upper()
+
+    p.push("words", [words, count], revise=False)
+    p.push("pick", [pick, upper], revise=False)
+    assert(p.run("pick") == "C")
+    assert(p.run("pick", 1) == "A")
+
+def test_parallel_independent_stages():
+    import threading
+    barrier = threading.Barrier(3, timeout = 5)
+
+    def hyperparameters() -> dict:
+        barrier.wait()
+        return {"scale" : 2}
+
+    def model() -> float:
+        barrier.wait()
+        return 1.5
+
+    def datasource() -> list:
+        barrier.wait()
+        return [1, 2, 3]
+
+    def train(d: dict, m: float, l: list) -> float:
+        return sum(l) * m * d["scale"]
+
+    p = Pipeline("test-parallel", workers = 3)
+    p.push("train", [hyperparameters, model, datasource, train], revise = False)
+    assert(p.run("train") == 18.0)
+    assert(p.run("train") == 18.0)
+
+def test_parallel_matches_sequential(p):
+    p.rings[0].workers = 4
+    assert(p.run("sample-1", 4) == test_sentence*4)
+    assert(p.run("sample-2", 3, test_sentence) == test_sentence*3)
+
+def test_async_pipeline(p):
+    import asyncio
+    calls = []
+
+    async def slow_double(i: int) -> float:
+        calls.append(i)
+        await asyncio.sleep(0.05)
+        return i * 2.0
+
+    def describe(f: float) -> str:
+        return str(f)
+
+    p.push("async", [slow_double, describe], revise=False)
+
+    async def classify_many():
+        return await asyncio.gather(p.arun("async", 2), p.arun("async", 2), p.arun("async", 3))
+
+    assert(asyncio.run(classify_many()) == ["4.0", "4.0", "6.0"])
+    assert(sorted(calls) == [2, 3])
+    assert(asyncio.run(p.arun("sample-1", 2)) == test_sentence*2)
+
+def test_segmented_serialization(tmp_path, monkeypatch):
+    import os
+    monkeypatch.chdir(tmp_path)
+    calls = []
+
+    def words() -> list:
+        calls.append("words")
+        return ["hello", "world"]
+
+    def join(w: list) -> str:
+        calls.append("join")
+        return " ".join(w)
+
+    def build():
+        p = Pipeline("test-store")
+        p.push("join", [words, join], revise=False)
+        return p
+
+    p = build()
+    assert(p.run("join") == test_sentence)
+    p.serialize()
+    blobs = os.path.join(p.base_path, "blobs")
+    saved = {f: os.stat(os.path.join(blobs, f)).st_mtime_ns for f in os.listdir(blobs)}
+    assert(len(saved) == 3)
+
+    q = build()
+    q.deserialize()
+    assert(q.runs[0]['ring'] == "join")
+    assert(all(type(o).__name__ == "Segment" for o in q.rings[0].cache.entries.values()))
+    root, = q.rings[0].meta.nodes['root']['outputs']
+    assert(root[0].type is str and not root[0].loaded)
+    assert(q.run("join") == test_sentence)
+    assert(calls == ["words", "join"])
+
+    # unchanged entries are not written again
+    q.serialize()
+    assert({f: os.stat(os.path.join(blobs, f)).st_mtime_ns for f in os.listdir(blobs)} == saved)
+
+    # restored root outputs are read once another ring uses them
+    r = build()
+    r.deserialize()
+    root, = r.rings[0].meta.nodes['root']['outputs']
+
+    def shout(s: str) -> bytes:
+        return s.upper().encode()
+
+    r.push("shout", [shout], revise=False)
+    assert(r.run("shout") == test_sentence.upper().encode())
+    assert(root[0].loaded)
+
+def test_bounded_run_history(tmp_path):
+    import json
+    spill = tmp_path / "runs.jsonl"
+    p = Pipeline("test-history", history = 2, history_path = str(spill))
+    p.push("sample-1", [lambda: test_sentence, lambda s: s], revise=False)
+    for _ in range(5):
+        p.run("sample-1")
+    assert(len(p.runs) == 2)
+    assert(p.runs[0]['ring'] == "sample-1")
+    assert(len(spill.read_text().splitlines()) == 5)
+    assert(json.loads(spill.read_text().splitlines()[0])['ring'] == "sample-1")
+
+def test_revisions_share_cache(p):
+    def shout(s: str) -> str:
+        return s.upper()
+
+    p.revise()
+    p.push("sample-1", [lambda: test_sentence, shout], revise=False)
+    assert(p.run("sample-1") == test_sentence.upper())
+    assert(p.rings[0].cache is p.rings[1].cache)
+    assert(p.rings[0].lock is p.rings[1].lock)
+    assert("sample-2" in p.rings[0].plans and len(p.rings[0].plans.maps[0]) == 1)
+
+    p.restore_graph(1)
+    assert(p.run("sample-1", 2) == test_sentence*2)
+    p.restore_graph(1)
+    assert(p.run("sample-1") == test_sentence.upper())
+
+def test_revisions_keep_executor():
+    from concurrent.futures import ThreadPoolExecutor
+
+    def shout(s: str) -> str:
+        return s.upper()
+
+    with ThreadPoolExecutor(max_workers = 2) as executor:
+        p = Pipeline("test-executor")
+        p.rings[0].executor = executor
+        p.push("sample-1", [lambda: test_sentence, shout], revise=True)
+        assert(p.rings[0].executor is executor and p.rings[1].executor is executor)
+        assert(p.run("sample-1") == test_sentence.upper())
+
+def square(i: int) -> int:
+    return i * i
+
+def negate(i: int) -> float:
+    return -float(i)
+
+def test_process_pool_only_receives_edge_calls(tmp_path, monkeypatch):
+    from concurrent.futures import ProcessPoolExecutor
+    from referenceai.graph import GraphRing
+    from referenceai.metrics import MetricsRegistry
+
+    def unpicklable(self):
+        raise AssertionError("the ring must not be sent to the workers")
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(GraphRing, "__getstate__", unpicklable)
+    metrics = MetricsRegistry()
+    with ProcessPoolExecutor(max_workers = 2) as executor:
+        p = Pipeline("test-processes", metrics = metrics)
+        p.rings[0].executor = executor
+        p.push("square", [square, negate], revise = False)
+        assert(p.run("square", 3) == -9.0)
+    assert(metrics.histogram("rai_edge_wall_seconds", fn = "negate").count == 1)
+
+def test_classify_batch(ai, images):
+    ai.train()
+    assert([ai.classify(image) for image in images] == [0, 1, 1, 0])
+    assert(ai.classify_batch(images) == [0, 1, 1, 0])
+
+def test_micro_batcher(ai, images):
+    from concurrent.futures import ThreadPoolExecutor
+    ai.train()
+    with ai.micro_batcher(max_batch_size = 4, max_latency = 0.05) as batcher:
+        with ThreadPoolExecutor(max_workers = 4) as pool:
+            assert(list(pool.map(batcher, images)) == [0, 1, 1, 0])
+
+def test_update_finetunes_on_new_samples(ai, images):
+    import numpy as np
+    ai.train()
+    provider = ai.provider
+    transforms = provider.transforms
+
+    with pytest.raises(TypeError):
+        # a missing label must never be filled in with a prediction
+        ai.update(images[1])
+    ai.update(images[1], 1)
+    ai.update_bulk(np.stack(images[2:]), [1, 0])
+    ds = provider.ds
+    model = ai.rings[0].meta.nodes['root']['outputs'][0][0]
+
+    # 1 new sample + 2 replayed, then 2 new + 2 replayed out of train set and the first update
+    assert([n for n, _ in model.finetuned] == [3] * 3 + [4] * 3)
+    assert(all(labels[0] == 1 for _, labels in model.finetuned[:3]))
+    assert(len(ds.updates) == 3 and ds.updates.trained == 3)
+    assert(provider.transforms == transforms)
+    assert(ai.classify(images[1]) == 1)
+
+def test_cache_keeps_latest_entry_of_every_edge(ai, images):
+    import numpy as np
+    ai.rings[0].cache.max_entries = 4
+    ai.train()
+    transforms = ai.provider.transforms
+    for i in range(20):
+        ai.classify(np.full((4, 4), i, dtype = np.uint8))
+    # the train ring is still cached, for itself and for producers
+    ai.train()
+    ai.update(images[1], 1)
+    assert(ai.provider.transforms == transforms)
+
+def test_cache_sizes_nested_arrays():
+    import numpy as np
+    from referenceai.graph import EdgeCache
+
+    class Holder():
+        def __init__(self):
+            self.arrays = {"x" : np.zeros(1000), "y" : [np.zeros(500)]}
+
+    cache = EdgeCache(max_bytes = 10000)
+    cache.put(("a", ()), (Holder(),))
+    assert(cache.nbytes >= 12000)
+    cache.put(("b", ()), (Holder(), 1))
+    assert(len(cache) == 1 and ("b", ()) in cache)
+
+def test_producers_do_not_shadow_published_outputs(ai, images):
+    ai.train()
+    trained = ai.rings[0].meta.nodes['root']['outputs'][0][0]
+    # evicting the train ring makes update run its prefix again for the data
+    # source and hyperparameters, the new untrained model must not be used
+    ai.rings[0].cache.clear()
+    ai.update(images[1], 1)
+    assert(len(trained.finetuned) == 3)
+
+def test_update_uses_raw_datasource(tmp_path, monkeypatch):
+    import copy
+    import numpy as np
+    from .conftest import MeanProvider, MeanDataSource
+    from referenceai.pipeline import PipelineAI
+    from referenceai.datasource import DataSource
+    from referenceai.transform import Transform
+
+    class CopyingProvider(MeanProvider):
+        def transform(self, ds: DataSource) -> (DataSource, Transform):
+            # like MNIST, train on a transformed copy of the data source
+            ds, t = super().transform(ds)
+            x, y = ds.train_set()
+            transformed = copy.copy(ds)
+            transformed.train_set = lambda: (x[..., None], t.forward_transform(y))
+            return transformed, t
+
+    monkeypatch.chdir(tmp_path)
+    ai = PipelineAI("test-copy", CopyingProvider(MeanDataSource("mean", base_path = str(tmp_path / "dataset"))))
+    ai.train()
+    model, _ = ai.update(np.full((4, 4), 230, dtype = np.uint8), 1)
+    assert([n for n, _ in model.finetuned] == [3] * 3)
+
+def test_closures_and_instances_do_not_share_cache(p):
+    def const(v):
+        def f() -> int:
+            return v
+        return f
+
+    class Scale():
+        def __init__(self, k):
+            self.k = k
+
+        def apply(self, i: int) -> str:
+            return str(i * self.k)
+
+    def show(i: int) -> str:
+        return str(i)
+
+    p.push("a", [const(1), show], revise=False)
+    p.push("b", [const(2), show], revise=False)
+    assert(p.run("a") == "1")
+    assert(p.run("b") == "2")
+
+    p.push("double", [Scale(2).apply], revise=False)
+    p.push("triple", [Scale(3).apply], revise=False)
+    assert(p.run("double", 5) == "10")
+    assert(p.run("triple", 5) == "15")
+
+def test_unfingerprintable_inputs_bypass_cache(p):
+    calls = []
+
+    def call(f: object) -> int:
+        calls.append(f)
+        return f()
+
+    def double(i: int) -> int:
+        return i * 2
+
+    p.push("call", [call, double], revise=False)
+    assert(p.run("call", lambda: 1) == 2)
+    assert(p.run("call", lambda: 2) == 4)
+    assert(len(calls) == 2)
+
+def test_update_without_finetune_retrains(tmp_path, monkeypatch):
+    import numpy as np
+    from .conftest import MeanProvider, MeanDataSource
+    from referenceai.pipeline import PipelineAI
+
+    class RetrainingProvider(MeanProvider):
+        finetune = None
+
+    monkeypatch.chdir(tmp_path)
+    provider = RetrainingProvider(MeanDataSource("mean", base_path = str(tmp_path / "dataset")))
+    ai = PipelineAI("test-retrain", provider)
+    ai.train()
+    transforms = provider.transforms
+    model, _ = ai.update(np.full((4, 4), 230, dtype = np.uint8), 1)
+    assert(provider.transforms == transforms + 1 and model.finetuned == [])
+
+def test_restored_pipeline_does_not_transform_again(ai):
+    from .conftest import MeanProvider, MeanDataSource
+    from referenceai.pipeline import PipelineAI
+    ai.train()
+    ai.serialize()
+
+    provider = MeanProvider(MeanDataSource("mean", base_path = ai.provider.ds.base_path))
+    restored = PipelineAI("test-ai", provider)
+    restored.train()
+    assert(provider.transforms == 0)
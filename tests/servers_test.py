@@ -0,0 +1,160 @@
+from referenceai.servers import RESTServer, GraphQLServer
+from referenceai.servers.graphql import parse, GraphQLError
+from concurrent.futures import ThreadPoolExecutor
+import http.client
+import json
+import pytest
+
+@pytest.fixture
+def rest(ai):
+    server = RESTServer(ai, workers = 2, max_latency = 0.01)
+    host, port = server.start()
+    yield host, port
+    server.shutdown()
+
+def request(conn, method, path, body = None):
+    conn.request(method, path, body = None if body is None else json.dumps(body),
+                 headers = {"Content-Type" : "application/json"})
+    response = conn.getresponse()
+    return response.status, json.loads(response.read())
+
+def test_rest_server_keeps_connection_alive(rest, images):
+    conn = http.client.HTTPConnection(*rest, timeout = 10)
+    assert(request(conn, "GET", "/health") == (200, {"status" : "ok"}))
+    assert(request(conn, "POST", "/classify", {"image" : images[1].tolist()}) == (200, {"label" : 1}))
+    status, body = request(conn, "POST", "/classify_batch", {"images" : [i.tolist() for i in images]})
+    assert(status == 200 and body == {"labels" : [0, 1, 1, 0]})
+    conn.close()
+
+def test_rest_server_concurrent_requests(rest, images):
+    def classify(i):
+        conn = http.client.HTTPConnection(*rest, timeout = 10)
+        try:
+            return request(conn, "POST", "/classify", {"image" : images[i % 4].tolist()})[1]["label"]
+        finally:
+            conn.close()
+
+    with ThreadPoolExecutor(max_workers = 16) as pool:
+        labels = list(pool.map(classify, range(32)))
+    assert(labels == [[0, 1, 1, 0][i % 4] for i in range(32)])
+
+def test_rest_server_errors(rest):
+    conn = http.client.HTTPConnection(*rest, timeout = 10)
+    assert(request(conn, "GET", "/missing")[0] == 404)
+    assert(request(conn, "POST", "/classify", {"images" : []})[0] == 400)
+    assert(request(conn, "POST", "/classify", {"image" : [[1, 2], [3]]})[0] == 400)
+    conn.close()
+
+def test_rest_server_idle_connections(ai, images):
+    server = RESTServer(ai, concurrency = 2, idle_timeout = 0.5)
+    host, port = server.start()
+    idle = [http.client.HTTPConnection(host, port, timeout = 10) for _ in range(2)]
+    try:
+        for conn in idle:
+            assert(request(conn, "GET", "/health")[0] == 200)
+        # the idle keep-alive connections do not hold the two slots
+        conn = http.client.HTTPConnection(host, port, timeout = 2)
+        assert(request(conn, "POST", "/classify", {"image" : images[1].tolist()}) == (200, {"label" : 1}))
+        conn.close()
+    finally:
+        for conn in idle:
+            conn.close()
+        server.shutdown()
+
+def test_rest_server_malformed_image_fails_alone(rest, images):
+    def classify(image):
+        conn = http.client.HTTPConnection(*rest, timeout = 10)
+        try:
+            return request(conn, "POST", "/classify", {"image" : image})[0]
+        finally:
+            conn.close()
+
+    # an image of another shape can not be stacked with the others
+    bodies = [images[1].tolist()] * 4 + [[[1, 2, 3]]]
+    with ThreadPoolExecutor(max_workers = 5) as pool:
+        statuses = list(pool.map(classify, bodies))
+    assert(statuses[:4] == [200] * 4)
+
+def test_graphql_parse():
+    operation, = parse('query Q($img: [[Int!]]! = [[1]]) { a: classify(image: $img) health }')
+    assert(operation.kind == "query" and operation.name == "Q")
+    assert(operation.defaults == {"img" : [[1]]})
+    assert([(f.alias, f.name) for f in operation.fields] == [("a", "classify"), ("health", "health")])
+    with pytest.raises(GraphQLError):
+        parse('{ classify(image: [1) }')
+
+def test_graphql_batches_classify_fields(ai, images, monkeypatch):
+    import numpy as np
+    ai.train()
+    model = ai.rings[0].meta.nodes['root']['outputs'][0][0]
+    batches = []
+    predict = model.predict
+    monkeypatch.setattr(model, "predict", lambda batch: batches.append(len(batch)) or predict(batch))
+
+    server = GraphQLServer(ai)
+    query = """query($a: [[Int]], $b: [[Int]], $all: [[[Int]]]) {
+        a: classify(image: $a)
+        b: classify(image: $b)
+        c: classify(image: $a)
+        all: classify_batch(images: $all)
+    }"""
+    variables = {"a" : images[0].tolist(), "b" : images[1].tolist(), "all" : [i.tolist() for i in images]}
+    assert(server.execute(query, variables) == {"a" : 0, "b" : 1, "c" : 0, "all" : [0, 1, 1, 0]})
+    assert(batches == [2])
+
+    # images seen before hit the cache whatever they were batched with
+    bright = np.full((4, 4), 200, dtype = np.uint8).tolist()
+    data = server.execute("query($a: [[Int]], $b: [[Int]]) { a: classify(image: $a) b: classify(image: $b) }",
+                          {"a" : images[1].tolist(), "b" : bright})
+    assert(data == {"a" : 1, "b" : 1})
+    assert(server.execute("{ a: classify(image: %s) }" % images[0].tolist()) == {"a" : 0})
+    assert(batches == [2, 1])
+
+    # an update replaces the model, cached results are dropped
+    ai.update(images[1], 1)
+    assert(server.execute("{ a: classify(image: %s) }" % images[0].tolist()) == {"a" : 0})
+    assert(batches == [2, 1, 1])
+
+def test_graphql_mixed_shapes(ai, images, monkeypatch):
+    import numpy as np
+    ai.train()
+    model = ai.rings[0].meta.nodes['root']['outputs'][0][0]
+    batches = []
+    predict = model.predict
+
+    def small_only(batch):
+        batches.append(batch.shape)
+        if batch.shape[1:] != (4, 4):
+            raise ValueError("Expected 4x4 images")
+        return predict(batch)
+    monkeypatch.setattr(model, "predict", small_only)
+
+    server = GraphQLServer(ai)
+    big = np.full((5, 5), 200, dtype = np.uint8).tolist()
+    query = "query($a: [[Int]], $b: [[Int]], $big: [[Int]]) { a: classify(image: $a) big: classify(image: $big) b: classify(image: $b) }"
+    body = server.graphql({"query" : query, "variables" : {"a" : images[0].tolist(), "b" : images[1].tolist(), "big" : big}})
+    assert(body["data"] == {"a" : 0, "big" : None, "b" : 1})
+    assert(len(body["errors"]) == 1 and body["errors"][0]["path"] == ["big"])
+    assert(batches == [(2, 4, 4), (1, 5, 5)])
+    with pytest.raises(GraphQLError):
+        server.execute("{ big: classify(image: %s) }" % big)
+
+def test_graphql_server(ai, images):
+    server = GraphQLServer(ai)
+    assert(server.batcher is None)
+    conn = http.client.HTTPConnection(*server.start(), timeout = 10)
+    try:
+        assert(request(conn, "POST", "/graphql", {"query" : "mutation { train }"}) == (200, {"data" : {"train" : True}}))
+        status, body = request(conn, "POST", "/graphql", {"query" : "{ label: classify(image: %s) }" % images[1].tolist()})
+        assert(status == 200 and body == {"data" : {"label" : 1}})
+        status, body = request(conn, "POST", "/graphql", {"query" : "{ unknown }"})
+        assert(body["data"] is None and len(body["errors"]) == 1)
+    finally:
+        conn.close()
+        server.shutdown()
+
+def test_graphql_update(ai, images):
+    server = GraphQLServer(ai)
+    data = server.execute('mutation($i: [[Int]]) { train update(image: $i, label: 1) }', {"i" : images[1].tolist()})
+    assert(data == {"train" : True, "update" : True})
+    assert(len(ai.provider.ds.updates) == 1)
@@ -0,0 +1,34 @@
+from referenceai.dataset.storage import ChunkedArray, GrowableArray
+import numpy as np
+import pytest
+
+def test_chunked_array(tmp_path):
+    directory = str(tmp_path / "images")
+    array = ChunkedArray(directory, chunk_size = 4)
+    rows = np.arange(11 * 6, dtype = np.uint8).reshape(11, 2, 3)
+    array.append(rows[0])
+    array.extend(rows[1:7])
+    array.extend(rows[7:])
+
+    assert(len(array) == 11 and array.shape == (11, 2, 3))
+    assert(np.array_equal(array[5], rows[5]) and np.array_equal(array[-1], rows[-1]))
+    assert(np.array_equal(array[2:10], rows[2:10]))
+    assert(np.array_equal(array[::3], rows[::3]))
+    assert(np.array_equal(array[np.array([9, 0, 4])], rows[[9, 0, 4]]))
+    with pytest.raises(IndexError):
+        array[11]
+    with pytest.raises(ValueError):
+        array.append(np.zeros((3, 2), dtype = np.uint8))
+
+    # reopening only reads the metadata until rows are accessed
+    reopened = ChunkedArray(directory)
+    assert(len(reopened) == 11 and reopened.chunks == {})
+    reopened.append(rows[0])
+    assert(np.array_equal(np.asarray(reopened), np.concatenate([rows, rows[:1]])))
+
+def test_growable_array():
+    array = GrowableArray(capacity = 1)
+    for i in range(10):
+        array.append(i)
+    assert(len(array) == 10 and len(array.data) == 16)
+    assert(array[3:6].tolist() == [3, 4, 5])
@@ -0,0 +1,22 @@
+from referenceai.transform import CategoricalTransform
+import numpy as np
+import pytest
+
+def test_categorical_roundtrip():
+    labels = np.array([3, 1, 4, 1, 5, 9, 2, 6], dtype=np.uint8)
+    t = CategoricalTransform(dtype = np.uint8).fit(labels)
+    onehot = t.forward_transform(labels)
+    assert(onehot.dtype == np.uint8)
+    assert(onehot.shape == (8, 7))
+    assert(np.array_equal(onehot.sum(axis = 1), np.ones(8)))
+    assert(np.array_equal(t.inverse_transform(onehot), labels))
+
+def test_categorical_decodes_scores():
+    t = CategoricalTransform().fit(np.arange(10))
+    scores = np.random.rand(5, 10).astype(np.float32)
+    assert(np.array_equal(t.inverse_transform(scores), np.argmax(scores, axis = 1)))
+
+def test_categorical_unknown():
+    t = CategoricalTransform().fit(np.array([0, 1]))
+    with pytest.raises(ValueError):
+        t.forward_transform(np.array([2]))